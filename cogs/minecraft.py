@@ -1,8 +1,12 @@
+import io
+import os
+import re
 import asyncio
 import contextlib
 import time
 import datetime
 import threading
+import functools
 import json
 
 import discord
@@ -16,6 +20,14 @@ from streamlink.options import Options
 from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 from dotenv import load_dotenv
 from utils import default
+from utils.splits import SplitStats
+from utils.live import LiveFeed
+from utils.heatmap import SpatialHeatmap
+from utils.scheduler import DetectorScheduler, DetectorTask
+from utils.matching import get_matcher, ColourGate, TileClassifier
+from utils.framepool import FramePool
+from utils.motion import CoordinateFilter
+from utils.recorder import Recorder, detector_rois
 
 load_dotenv()
 plt.switch_backend('agg')
@@ -24,53 +36,135 @@ plt.switch_backend('agg')
 class Minecraft(commands.Cog):
     def __init__(self, client: default.DiscordBot):
         self.client = client
-        self.frame = None
-        self.stopMainFlag = False
 
-        self.lock = threading.Lock()
-        self.igt = IGT(self.client)
-        self.biome = Biome(self.client)
-        self.achievement = Achievement(self.client)
-        self.coordinates = Coordinates(self.client)
-        # self.inventory = Inventory(self.client)
-        self.other = Other(self.client)
+        self.channels = [channel.strip().lower() for channel in os.environ.get("TWITCH_CHANNELS", "forsen").split(",") if channel.strip()]
+        self.bank = TemplateBank()
+        self.scheduler = DetectorScheduler(int(os.environ.get("MINECRAFT_WORKERS", os.cpu_count() or 4)), float(os.environ.get("MINECRAFT_CPU_BUDGET", 1.0)))
 
-    def timeToString(self, timeIGT: datetime.time):
-        formattedIGT = timeIGT.strftime("%M:%S.%f")
-        return formattedIGT[:-3]
+        self.pipelines: dict[str, Pipeline] = {}
+        for channel in self.channels:
+            self.pipelines[channel] = Pipeline(self.client, channel, self.bank, self.scheduler, isPrimary=channel == self.channels[0])
+
+    def get_pipeline(self, channel: str = None):
+        if channel is None:
+            return self.pipelines[self.channels[0]]
+
+        pipeline = self.pipelines.get(channel.lower())
+        if pipeline is None:
+            raise commands.BadArgument(f"Not tracking {channel}")
+
+        return pipeline
+
+    def is_live_minecraft(self, pipeline: "Pipeline"):
+        status = self.client.twitchAPI.channels[pipeline.channel]
+        return status.isIntro is False and status.isOnline is True and status.game == "Minecraft"
+
+    async def cached_url(self, data: bytes = None, filename: str = None, path: str = None):
+        try:
+            if path is not None:
+                return await self.client.attachments.file_url(path)
+            return await self.client.attachments.url(data, filename)
+        except discord.HTTPException as e:
+            print(f"Attachment cache: {e}")
+            return None
+
+    async def biome_icon(self, biomeID: str):
+        iconPath = self.bank.biomeIcons.get(biomeID)
+        url = await self.cached_url(path=iconPath) if iconPath is not None else None
+        return url or "https://cdn.discordapp.com/attachments/988994875234082829/1139301216459964436/3x.gif"
+
+    async def send_image(self, ctx: commands.Context, data: bytes, filename: str):
+        # Identical renders (a standing player, F3 closed, heatmaps between visits) resolve to the cached url instead of uploading again
+        url = await self.cached_url(data, filename)
+        if url is None:
+            await ctx.send(file=discord.File(io.BytesIO(data), filename=filename))
+            return
+
+        embed = discord.Embed(color=0x000000, timestamp=ctx.message.created_at)
+        embed.set_image(url=url)
+        embed.set_author(name=ctx.author, icon_url=ctx.author.display_avatar.url)
+        embed.set_footer(text="Bot made by Tuxsuper", icon_url=self.client.DEV.display_avatar.url)
+        await ctx.send(embed=embed)
+
+    def secondsToString(self, seconds: float):
+        if seconds is None:
+            return "-"
+
+        minutes, seconds = divmod(seconds, 60)
+        return f"{int(minutes):02d}:{seconds:06.3f}"
 
     @commands.hybrid_command(aliases=["m"], description="Forsen's Minecraft Status")
     @commands.cooldown(1, 10, commands.BucketType.channel)
     @commands.guild_only()
-    async def minecraft(self, ctx: commands.Context):
-        twitchAPI = self.client.twitchAPI
-        if twitchAPI.isIntro is False and twitchAPI.isOnline is True and twitchAPI.game == "Minecraft":
-            embed = discord.Embed(title="Forsen's Minecraft Status", description=None, color=0x000000, timestamp=ctx.message.created_at)
-            embed.add_field(name="Ingame Time:", value=self.timeToString(self.igt.timeIGT), inline=True)
-            embed.add_field(name="Biome:", value=self.biome.biomeText[self.biome.biomeID], inline=True)
-            embed.add_field(name="Phase:", value=self.achievement.numberStructute(), inline=True)
-            embed.add_field(name="Seeds:", value=self.other.generatingCounter, inline=True)
-            embed.add_field(name="Deaths:", value=self.other.deathCounter, inline=True)
-            embed.set_thumbnail(url="https://cdn.discordapp.com/attachments/988994875234082829/1139301216459964436/3x.gif")
+    async def minecraft(self, ctx: commands.Context, channel: str = None):
+        pipeline = self.get_pipeline(channel)
+        if self.is_live_minecraft(pipeline):
+            embed = discord.Embed(title=f"{pipeline.displayName}'s Minecraft Status", description=None, color=0x000000, timestamp=ctx.message.created_at)
+            embed.add_field(name="Ingame Time:", value=pipeline.timeToString(pipeline.igt.timeIGT), inline=True)
+            embed.add_field(name="Biome:", value=pipeline.biome.biomeText[pipeline.biome.biomeID], inline=True)
+            embed.add_field(name="Phase:", value=pipeline.achievement.numberStructute(), inline=True)
+            embed.add_field(name="Seeds:", value=pipeline.other.generatingCounter, inline=True)
+            embed.add_field(name="Deaths:", value=pipeline.other.deathCounter, inline=True)
+            embed.add_field(name="Inventory:", value=pipeline.inventory.countsToString(), inline=True)
+            embed.set_thumbnail(url=await self.biome_icon(pipeline.biome.biomeID))
             embed.set_author(name=ctx.author, icon_url=ctx.author.display_avatar.url)
             embed.set_footer(text="Bot made by Tuxsuper", icon_url=self.client.DEV.display_avatar.url)
             await ctx.send(embed=embed)
 
+    @commands.hybrid_command(aliases=["s"], description="Forsen's Minecraft Split Statistics")
+    @commands.cooldown(1, 10, commands.BucketType.channel)
+    @commands.guild_only()
+    async def splits(self, ctx: commands.Context, channel: str = None):
+        pipeline = self.get_pipeline(channel)
+        runSummary = pipeline.splitStats.runSummary()
+
+        description = f"Seeds: {runSummary['runs']}\nDeaths per seed: {runSummary['deathsPerRun']:.2f}\nDeathless: {runSummary['deathlessRate']:.1%}\nReset before Nether: {runSummary['startResetRate']:.1%}"
+        embed = discord.Embed(title=f"{pipeline.displayName}'s Minecraft Splits", description=description, color=0x000000, timestamp=ctx.message.created_at)
+
+        for phase in self.bank.achievementPriority:
+            if phase == "Start":
+                continue
+
+            phaseSummary = pipeline.splitStats.phaseSummary(phase)
+            if phaseSummary is None:
+                continue
+
+            if phaseSummary["resetRate"] is None:
+                resetLine = f"Finished: {phaseSummary['count']}"
+            else:
+                resetLine = f"Reset here: {phaseSummary['resetRate']:.1%} ({phaseSummary['resets']})"
+
+            percentiles = phaseSummary["percentiles"]
+            value = (
+                f"Reached: {phaseSummary['count']} ({phaseSummary['rate']:.1%})\n"
+                f"PB: {self.secondsToString(phaseSummary['best'])}\n"
+                f"Median: {self.secondsToString(percentiles[0.5])}\n"
+                f"P90: {self.secondsToString(percentiles[0.9])}\n"
+                f"{resetLine}"
+            )
+            embed.add_field(name=f"{phase}:", value=value, inline=True)
+
+        embed.set_author(name=ctx.author, icon_url=ctx.author.display_avatar.url)
+        embed.set_footer(text="Bot made by Tuxsuper", icon_url=self.client.DEV.display_avatar.url)
+        await ctx.send(embed=embed)
+
     @commands.hybrid_command(aliases=["c"], description="Forsen's Minecraft Coords")
     @commands.cooldown(1, 10, commands.BucketType.channel)
     @commands.guild_only()
-    async def coords(self, ctx: commands.Context):
-        twitchAPI = self.client.twitchAPI
-        if twitchAPI.isIntro is False and twitchAPI.isOnline is True and twitchAPI.game == "Minecraft":
-            if len(self.coordinates.coordsList) >= 2:
-                x_values = [coord[0] for coord in self.coordinates.coordsList[:-2]]
-                z_values = [coord[2] for coord in self.coordinates.coordsList[:-2]]
+    async def coords(self, ctx: commands.Context, channel: str = None):
+        pipeline = self.get_pipeline(channel)
+        if self.is_live_minecraft(pipeline):
+            coordinates = pipeline.coordinates
+            coordsList = coordinates.coordsList # A reset swaps in a new list, this one stays intact
+            if len(coordsList) >= 2:
+                x_values = [coord[0] for coord in coordsList]
+                z_values = [coord[2] for coord in coordsList]
 
                 plt.plot(x_values, z_values, color='black')
-                
+
                 max_x, min_x = max(x_values), min(x_values)
                 max_z, min_z = max(z_values), min(z_values)
-                
+
                 diff_x = (max_x-min_x)*0.1
                 diff_z = (max_z-min_z)*0.1
 
@@ -79,10 +173,11 @@ class Minecraft(commands.Cog):
 
                 img = plt.imread("./assets/images/minecraft/forsenE.png")
                 imagebox = OffsetImage(img, zoom=0.1)
-                ab = AnnotationBbox(imagebox, (self.coordinates.coordsList[-2:][0][0], self.coordinates.coordsList[-2:][0][2]), frameon=False)
+                position = coordinates.estimate() or coordsList[-1]
+                ab = AnnotationBbox(imagebox, (position[0], position[2]), frameon=False)
                 plt.gca().add_artist(ab)
 
-                for phaseCoords in self.coordinates.achievementCheck:
+                for phaseCoords in coordinates.achievementCheck:
                     phase = phaseCoords[0]
                     check = phaseCoords[1]
 
@@ -98,43 +193,332 @@ class Minecraft(commands.Cog):
 
             plt.xlabel('X Coordinate')
             plt.ylabel('Z Coordinate')
-            plt.title('Forsen Coordinates')
+            plt.title(f'{pipeline.displayName} Coordinates')
 
-            filename = "./assets/images/coordinates.png"
-            plt.savefig(filename)
-            image = discord.File(filename)
+            image = io.BytesIO()
+            plt.savefig(image, format="png")
+            plt.close()
 
-            await ctx.send(file = image)
+            await self.send_image(ctx, image.getvalue(), "coordinates.png")
 
-            plt.close()
+    @commands.hybrid_command(aliases=["h"], description="Forsen's Minecraft Heatmap across all seeds")
+    @commands.cooldown(1, 10, commands.BucketType.channel)
+    @commands.guild_only()
+    async def heatmap(self, ctx: commands.Context, dimension: str = "nether", channel: str = None):
+        pipeline = self.get_pipeline(channel)
 
-    async def startMain(self):
+        dimension = dimension.lower()
+        if dimension not in ("overworld", "nether", "end"):
+            raise commands.BadArgument("Dimension must be overworld, nether or end")
+
+        filename = "./assets/images/heatmap.png"
+        if not pipeline.spatialHeatmap.render(dimension, filename, title=pipeline.displayName):
+            await default.embedMessage(client=self.client, ctx=ctx, description=f"No {dimension} data yet")
+            return
+
+        image = await asyncio.to_thread(self.client.attachments.read_file, filename)
+        await self.send_image(ctx, image, "heatmap.png")
+
+    @commands.hybrid_command(aliases=["p"], description="Forsen's Minecraft Pipeline Stats")
+    @commands.cooldown(1, 10, commands.BucketType.channel)
+    @commands.guild_only()
+    async def pipeline(self, ctx: commands.Context, channel: str = None):
+        pipeline = self.get_pipeline(channel)
+        poolStats = pipeline.framePool.stats()
+
+        embed = discord.Embed(title=f"{pipeline.displayName}'s Pipeline", description=f"State: {pipeline.state}", color=0x000000, timestamp=ctx.message.created_at)
+        embed.add_field(name="Frame Buffers:", value=f"{poolStats['inUse']}/{poolStats['size']} in use ({poolStats['megabytes']:.1f} MB)", inline=True)
+        embed.add_field(name="Frames:", value=f"{poolStats['published']} decoded, {poolStats['dropped']} skipped", inline=True)
+        embed.add_field(name="Allocations:", value=poolStats['allocations'], inline=True)
+
+        schedulerStats = self.scheduler.stats()
+        embed.add_field(name="CPU:", value=f"{schedulerStats['usage']:.2f}/{schedulerStats['cpuBudget']:.2f} cores used, {schedulerStats['demand']:.2f} requested", inline=False)
+        for taskStats in schedulerStats["tasks"]:
+            if not taskStats["name"].startswith(f"{pipeline.channel}:"):
+                continue
+
+            rate = 1 / taskStats["period"]
+            embed.add_field(name=f"{taskStats['name'].split(':', 1)[1]}:", value=f"{rate:.1f} Hz, {taskStats['cost'] * 1000:.1f} ms", inline=True)
+        embed.set_author(name=ctx.author, icon_url=ctx.author.display_avatar.url)
+        embed.set_footer(text="Bot made by Tuxsuper", icon_url=self.client.DEV.display_avatar.url)
+        await ctx.send(embed=embed)
+
+    @commands.hybrid_command(description="Records the detector regions of a stream")
+    async def record(self, ctx: commands.Context, action: str = "start", channel: str = None, fps: float = 5, mmap: bool = False):
+        if ctx.author.id != self.client.DEV.id:
+            return
+
+        pipeline = self.get_pipeline(channel)
+        if action == "start":
+            if pipeline.recordFPS is not None or pipeline.recorder is not None:
+                # The running recorder keeps its own fps and format, a new archive needs a stop first
+                await default.embedMessage(client=self.client, ctx=ctx, description=f"Already recording {pipeline.displayName}, stop it first")
+                return
+
+            pipeline.recordCompress = not mmap
+            pipeline.recordFPS = max(0.1, min(fps, 30))
+            if mmap:
+                archive = "uncompressed .npy chunks, memory mappable"
+            else:
+                archive = "compressed .npz chunks, only the index is memory mappable"
+            await default.embedMessage(client=self.client, ctx=ctx, description=f"Recording {pipeline.displayName} at {pipeline.recordFPS:g} fps ({archive})")
+        elif action == "stop":
+            # The capture thread closes the recorder on its next frame, or when it exits
+            pipeline.recordFPS = None
+            await default.embedMessage(client=self.client, ctx=ctx, description=f"Stopped recording {pipeline.displayName}")
+        else:
+            raise commands.BadArgument("Action must be start or stop")
+
+    async def startMain(self, channel: str):
+        await self.pipelines[channel].startMain()
+
+    async def stopMain(self, channel: str = None):
+        channels = self.channels if channel is None else [channel]
+        await asyncio.gather(*(self.pipelines[channel].stopMain() for channel in channels))
+
+    async def standby(self, channel: str):
+        await self.pipelines[channel].standby()
+
+
+class TemplateBank():
+    # Loaded once and shared read-only by every channel's detectors
+    def __init__(self):
+        self.igtTemplates = []
+        for i in range(10):
+            templatePath = f'./assets/images/minecraft/{i}.png'
+            template = cv2.imread(templatePath)
+            self.igtTemplates.append(template)
+
+        self.biomeTemplate = cv2.imread("./assets/images/minecraft/Biome.png")
+
+        with open("./assets/dictionaries/minecraft/biomes.json", "r", encoding="utf-8") as biomeJson:
+            biomeStr = biomeJson.read()
+            biomeData = json.loads(biomeStr)
+            biomeData["biome_text"][None] = None
+
+            self.biomeIDs = biomeData["biome_ids"]
+            self.biomeText = biomeData["biome_text"]
+
+        # The biome emojis were made from the BiomeIcons images and share their names
+        self.biomeIcons = {}
+        for biomeID, text in self.biomeText.items():
+            emoji = re.match(r"<:(\w+):\d+>", text or "")
+            if emoji is not None:
+                self.biomeIcons[biomeID] = f"./assets/images/minecraft/BiomeIcons/{emoji.group(1)}.png"
+
+        self.biomeImages = []
+        for biomeID in self.biomeIDs:
+            image = cv2.imread(f"./assets/images/minecraft/Biomes/{biomeID}.png")
+            self.biomeImages.append(image)
+
+        with open("./assets/dictionaries/minecraft/achievements.json", "r", encoding="utf-8") as achievementJson:
+            achievementStr = achievementJson.read()
+            achievementData = json.loads(achievementStr)
+
+            self.achievementPhases = achievementData["achievementPhases"]
+            self.achievementPriority = achievementData["achievementPriority"]
+
+        self.achievementTemplates = []
+        for phase in self.achievementPhases:
+            templatePath = f'./assets/images/minecraft/{phase}.png'
+            template = cv2.imread(templatePath)
+            self.achievementTemplates.append(template)
+
+        self.blockTemplate = cv2.imread("./assets/images/minecraft/Coordinates/Block.png")
+
+        self.coordTemplates = []
+        for i in range(10):
+            templatePath = f'./assets/images/minecraft/Coordinates/{i}.png'
+            template = cv2.imread(templatePath)
+            self.coordTemplates.append(template)
+
+        self.coordTemplates.append(cv2.imread("./assets/images/minecraft/Coordinates/minus.png"))
+
+        self.otherTemplates = (("Loading", (390, 414, 771, 1056), 0.5), ("Generating", (438, 459, 942, 975), 0.85),
+                               ("Died", (504, 528, 855, 1062), 0.3), ("Spectator", (555, 576, 879, 1038), 0.4))
+        self.otherImages = []
+        for templateText, _, _ in self.otherTemplates:
+            templatePath = f'./assets/images/minecraft/{templateText}.png'
+            template = cv2.imread(templatePath)
+            self.otherImages.append(template)
+
+        self.craftingTemplate = cv2.imread('./assets/images/minecraft/CraftingNew.png')
+
+        with open("./assets/dictionaries/minecraft/inventory.json", "r", encoding="utf-8") as inventoryJson:
+            inventoryStr = inventoryJson.read()
+            inventoryData = json.loads(inventoryStr)
+
+            self.inventoryItems = inventoryData["inventoryItems"]
+
+        self.itemTemplates = []
+        for item in self.inventoryItems:
+            templatePath = f'./assets/images/minecraft/InventoryIcons/{item}.png'
+            template = cv2.imread(templatePath, cv2.IMREAD_UNCHANGED)
+            self.itemTemplates.append(template)
+
+
+class Pipeline():
+    STANDBY_TTL = 10 * 60
+
+    def __init__(self, client: default.DiscordBot, channel: str, bank: TemplateBank, scheduler: DetectorScheduler, isPrimary: bool = False):
+        self.client = client
+        self.channel = channel
+        self.bank = bank
+        self.scheduler = scheduler
+        self.isPrimary = isPrimary
+
+        self.state = "idle"
+        self.standbyURL = None
+        self.stopEvent = threading.Event()
+        self.reopenEvent = threading.Event()
+        self.main_thread = None
+        self.pendingStart = False
+        self.recorder = None
+        self.recordFPS = None
+        self.recordCompress = True
+
+        self.splitStats = SplitStats(f"./data/{channel}/splits.json")
+        self.liveFeed = LiveFeed(self.client.loop)
+        self.spatialHeatmap = SpatialHeatmap(f"./data/{channel}/heatmap.json")
+        self.igt = IGT(self)
+        self.biome = Biome(self)
+        self.achievement = Achievement(self)
+        self.coordinates = Coordinates(self)
+        self.inventory = Inventory(self)
+        self.other = Other(self)
+
+        self.tasks = [
+            DetectorTask(f"{channel}:IGT", functools.partial(self.run_detector, self.igt.getIGT), 1/2, 1/2, 2),
+            DetectorTask(f"{channel}:Biome", functools.partial(self.run_detector, self.biome.getBiome), 1/5, 1/5, 2),
+            DetectorTask(f"{channel}:Achievement", functools.partial(self.run_detector, self.achievement.getAchievement), 1/5, 1/5, 1),
+            DetectorTask(f"{channel}:Coordinates", functools.partial(self.run_detector, self.coordinates.getCoords), 1/5, 1/10, 1),
+            DetectorTask(f"{channel}:Inventory", functools.partial(self.run_detector, self.inventory.getInventory), 1/20, 1/20, 1/2),
+            DetectorTask(f"{channel}:Other", functools.partial(self.run_detector, self.other.getOthers), 1/30, 1/30, 1/5),
+        ]
+
+        # Every detector can hold a frame at once, plus the current frame and the one being decoded
+        self.framePool = FramePool(min(scheduler.workers, len(self.tasks)) + 2)
+
+    def run_detector(self, detect):
+        with self.framePool.borrow() as frame:
+            if frame is None:
+                return False
+
+            return detect(frame)
+
+    def timeToString(self, timeIGT: datetime.time):
+        formattedIGT = timeIGT.strftime("%M:%S.%f")
+        return formattedIGT[:-3]
+
+    @property
+    def displayName(self):
+        # Helix display name once the Twitch users are resolved, it keeps the streamer's own casing
+        twitchAPI = getattr(self.client, "twitchAPI", None)
+        status = twitchAPI.channels.get(self.channel) if twitchAPI is not None else None
+        if status is None or status.userID is None:
+            return self.channel.capitalize()
+        return status.displayName
+
+    def liveState(self):
+        return {
+            "igt": self.timeToString(self.igt.timeIGT),
+            "biome": self.biome.biomeID,
+            "phase": self.achievement.numberStructute(),
+            "coords": next(reversed(self.coordinates.coordsList), None),
+            "seeds": self.other.generatingCounter,
+            "deaths": self.other.deathCounter,
+            "inventory": self.inventory.counts,
+        }
+
+    def reset_state(self):
         self.igt.timeIGT = datetime.time(minute=0, second=0, microsecond=0)
-        
+
         self.biome.biomeID = "unknown"
-        
+
         self.achievement.phase = ["Start"]
-        
-        self.coordinates.coordsList = []
+
+        self.coordinates.reset_path()
         self.coordinates.achievementCheck = [["Start", 0]] # Dimension POI
         self.coordinates.all_achievementCheck = self.coordinates.achievementCheck # Seed (all) POI
-        
+
+        self.inventory.counts = {}
+
         self.other.resultTemplate = None
         self.other.deathCounter = 0
         self.other.generatingCounter = 0
         self.other.isSpectator = False
-        
-        self.stopMainFlag = False
-        self.main_thread = threading.Thread(target=self.main)
+
+        self.liveFeed.reset(**self.liveState())
+
+    async def standby(self):
+        # Resolve the HLS url while the stream is in its intro so startMain can open it right away
+        if self.state != "idle":
+            return
+
+        self.state = "standby"
+        streamURL = await self.client.loop.run_in_executor(None, self.resolve_stream)
+
+        if self.state == "standby" and streamURL is not None:
+            self.standbyURL = (streamURL, time.monotonic())
+        elif self.state == "standby":
+            self.state = "idle"
+
+    async def startMain(self):
+        if self.state == "stopping":
+            # Back in Minecraft while the capture thread is still closing, start again once it has
+            self.pendingStart = True
+            return
+        if self.state == "running":
+            return
+
+        self.reset_state()
+
+        self.state = "running"
+        self.stopEvent = threading.Event()
+        self.main_thread = threading.Thread(target=self.main, args=(self.stopEvent,), name=f"Capture-{self.channel}")
         self.main_thread.start()
 
     async def stopMain(self):
-        self.stopMainFlag = True
-        self.main_thread.join()
+        if self.state == "standby":
+            self.state = "idle"
+            self.standbyURL = None
+            return
+
+        if self.state == "stopping":
+            self.pendingStart = False
+            return
+        if self.state != "running":
+            return
+
+        self.state = "stopping"
+        self.pendingStart = False
+        self.stopEvent.set()
+        for task in self.tasks:
+            self.scheduler.remove(task)
+
+        await asyncio.to_thread(self.main_thread.join)
+
+        self.main_thread = None
+        self.coordinates.flush_heatmap()
+        try:
+            await asyncio.to_thread(self.spatialHeatmap.save)
+        except OSError as e:
+            print(e)
+        self.splitStats.interruptRun()
+        self.state = "idle"
+
+        if self.pendingStart:
+            self.pendingStart = False
+            await self.startMain()
 
     async def startStreamlink(self):
+        # Called after the Twitch login so the capture reopens with the user token
+        self.standbyURL = None
+        self.reopenEvent.set()
+
+    def resolve_stream(self):
         session = streamlink.Streamlink()
-        _, pluginclass, resolved_url = session.resolve_url("twitch.tv/forsen")
+        _, pluginclass, resolved_url = session.resolve_url(f"twitch.tv/{self.channel}")
 
         options = Options()
         options.set("low-latency", True)
@@ -142,218 +526,287 @@ class Minecraft(commands.Cog):
 
         with contextlib.suppress(AttributeError):
             options.set("api-header", {"Authorization": self.client.twitchAPI.TWITCH.get_user_auth_token()})
-            
+
         plugin = pluginclass(session, resolved_url, options)
-        streams = plugin.streams()
-        for stream_interation in streams:
+        try:
+            streams = plugin.streams()
+        except streamlink.StreamlinkError as e:
+            print(e)
+            return None
+
+        stream = None
+        for stream_interation in streams or {}:
             if stream_interation.startswith("1080p"):
                 stream = streams[stream_interation]
 
         if not streams or not stream:
             print("Stream not found")
-            return
+            return None
 
-        self.cap = cv2.VideoCapture(stream.url)
+        return stream.url
 
-    def main(self):
-        asyncio.run(self.startStreamlink())
+    def open_capture(self):
+        streamURL = None
+        if self.standbyURL is not None and time.monotonic() - self.standbyURL[1] < self.STANDBY_TTL:
+            streamURL = self.standbyURL[0]
+        self.standbyURL = None
 
-        # self.cap = cv2.VideoCapture("./assets/forsen.mp4")
-        # self.cap.set(cv2.CAP_PROP_POS_MSEC, (141 * 60 + 00) * 1000)
+        if streamURL is None:
+            streamURL = self.resolve_stream()
+            if streamURL is None:
+                return None
 
-        igt_thread = threading.Thread(target=self.igt.getIGT)
-        igt_thread.start()
+        return cv2.VideoCapture(streamURL, cv2.CAP_FFMPEG, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 5000, cv2.CAP_PROP_READ_TIMEOUT_MSEC, 5000])
 
-        biome_thread = threading.Thread(target=self.biome.getBiome)
-        biome_thread.start()
+    def main(self, stopEvent: threading.Event):
+        self.reopenEvent.clear()
+        cap = None
+        failedReads = 0
 
-        achievement_thread = threading.Thread(target=self.achievement.getAchievement)
-        achievement_thread.start()
+        # cap = cv2.VideoCapture("./assets/forsen.mp4")
+        # cap.set(cv2.CAP_PROP_POS_MSEC, (141 * 60 + 00) * 1000)
 
-        coords_thread = threading.Thread(target=self.coordinates.getCoords)
-        coords_thread.start()
+        for task in self.tasks:
+            self.scheduler.add(task)
 
-        # inventory_thread = threading.Thread(target=self.inventory.getInventory)
-        # inventory_thread.start()
+        while not stopEvent.is_set():
+            if cap is None or self.reopenEvent.is_set() or failedReads >= 50:
+                self.reopenEvent.clear()
+                failedReads = 0
+                if cap is not None:
+                    cap.release()
 
-        other_thread = threading.Thread(target=self.other.getOthers)
-        other_thread.start()
+                cap = self.open_capture()
+                if cap is None or not cap.isOpened():
+                    cap = None
+                    stopEvent.wait(5)
+                    continue
 
-        while not self.stopMainFlag:
             try:
-                ret, frame = self.cap.read()
-                if not ret:
+                if not self.read_frame(cap):
+                    failedReads += 1
                     continue
 
-                self.frame = frame
-
-                # cv2.imshow("camCapture", frame)
-                # cv2.waitKey(1)
+                failedReads = 0
 
-                time.sleep(5 / 1000)
+                stopEvent.wait(5 / 1000)
 
             except Exception:
                 continue
 
-        self.cap.release()
-        igt_thread.join()
-        biome_thread.join()
-        achievement_thread.join()
-        coords_thread.join()
-        # inventory_thread.join()
-        other_thread.join()
+        if cap is not None:
+            cap.release()
+        self.framePool.clear()
+        self.stop_recording()
 
+    def read_frame(self, cap):
+        framePool = self.framePool
+        if framePool.shape is None:
+            ret, frame = cap.read()
+            if not ret:
+                return False
 
-class IGT():
-    def __init__(self, client: default.DiscordBot):
-        self.client = client
+            framePool.allocate(frame.shape, frame.dtype)
+            buffer = framePool.acquire()
+            try:
+                np.copyto(buffer.array, frame)
+            except Exception:
+                framePool.discard(buffer)
+                raise
+            framePool.publish(buffer)
+            return True
 
-        self.timeIGT = datetime.time(minute=0, second=0, microsecond=0)
+        buffer = framePool.acquire()
+        if buffer is None:
+            # Every buffer is still being read, skip decoding this frame
+            return cap.grab()
 
-        self.templates = []
-        for i in range(10):
-            templatePath = f'./assets/images/minecraft/{i}.png'
-            template = cv2.imread(templatePath)
-            self.templates.append(template)
+        # A buffer that is neither published nor discarded would stay out of the pool for good
+        try:
+            ret, frame = cap.read(buffer.array)
+            if not ret:
+                framePool.discard(buffer)
+                return False
+
+            if frame is not buffer.array and not np.may_share_memory(frame, buffer.array):
+                # Resolution changed, OpenCV allocated a new array
+                framePool.discard(buffer)
+                buffer = None
+                framePool.allocate(frame.shape, frame.dtype)
+                buffer = framePool.acquire()
+                np.copyto(buffer.array, frame)
+        except Exception:
+            if buffer is not None:
+                framePool.discard(buffer)
+            raise
+
+        # cv2.imshow("camCapture", buffer.array)
+        # cv2.waitKey(1)
+
+        framePool.publish(buffer)
+
+        if self.recordFPS is not None:
+            self.record_frame(buffer.array)
+        elif self.recorder is not None:
+            self.stop_recording()
+        return True
+
+    def record_frame(self, frame):
+        # Only the capture thread touches the recorder, so a frame is never half written to a chunk
+        if self.recorder is None:
+            path = f"./recordings/{self.channel}-{time.strftime('%Y%m%d-%H%M%S')}"
+            self.recorder = Recorder(path, detector_rois(self.bank), frame.shape, fps=self.recordFPS, compress=self.recordCompress)
+            print(f"Recording {self.channel} to {path}")
+
+        timestamp = time.time()
+        if not self.recorder.due(timestamp):
+            return
 
+        hidden = () if self.inventory.check_inventory_visible(frame) else ("crafting", "inventory")
+        self.recorder.record(frame, timestamp, self.liveState(), hidden)
 
-    def getIGT(self):
-        templateSize = [21, 27]
-        xPositions = [66, 84, 108, 126, 150, 168, 186]
+    def stop_recording(self):
+        # Closing waits for the last chunk to be written, keep that off the capture thread
+        recorder, self.recorder = self.recorder, None
+        self.recordFPS = None
+        if recorder is not None:
+            threading.Thread(target=recorder.close, name="Recorder", daemon=False).start()
 
-        breakFlag = False
-        while not self.client.minecraft.stopMainFlag:
-            time.sleep(1/2)
 
-            with self.client.minecraft.lock:
-                frame = self.client.minecraft.frame
+class IGT():
+    MATCHER = "bgr"
 
-            if frame is None:
-                continue
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.matcher = get_matcher(self.MATCHER)
 
-            # cv2.imshow("camCapture", frame)
-            # cv2.waitKey(1)
+        self.timeIGT = datetime.time(minute=0, second=0, microsecond=0)
 
-            frame = frame[81:108, 1683:1890]
+        self.templates = pipeline.bank.igtTemplates
 
-            numbers = []
-            for i in range(7):
-                windowX = xPositions[i]
-                windowY = 0
+    def read_igt(self, frame):
+        templateSize = [21, 27]
+        xPositions = [66, 84, 108, 126, 150, 168, 186]
 
-                window = frame[windowY:windowY + templateSize[1], windowX:windowX + templateSize[0]]
+        frame = frame[81:108, 1683:1890]
 
-                bestMatchVal = 0
-                bestMatchIndex = None
+        numbers = []
+        for i in range(7):
+            windowX = xPositions[i]
+            windowY = 0
 
-                for j, template in enumerate(self.templates):
-                    result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
-                    _, maxVal, _, _ = cv2.minMaxLoc(result)
+            window = frame[windowY:windowY + templateSize[1], windowX:windowX + templateSize[0]]
 
-                    if maxVal >= 0.5 and maxVal > bestMatchVal:
-                        bestMatchVal = maxVal
-                        bestMatchIndex = j
+            bestMatchVal = 0
+            bestMatchIndex = None
 
-                if bestMatchIndex is None:
-                    breakFlag = True
-                    break
+            for j, template in enumerate(self.templates):
+                maxVal, _ = self.matcher.match(window, template)
 
-                numbers.append(bestMatchIndex)
+                if maxVal >= 0.5 and maxVal > bestMatchVal:
+                    bestMatchVal = maxVal
+                    bestMatchIndex = j
 
-            if breakFlag:
-                breakFlag = False
-                continue
+            if bestMatchIndex is None:
+                return None
 
-            minute = numbers[0] * 10 + numbers[1]
-            second = numbers[2] * 10 + numbers[3]
-            millisecond = numbers[4] * 100 + numbers[5] * 10 + numbers[6]
-            self.timeIGT = datetime.time(minute=minute, second=second, microsecond=millisecond * 1000)
+            numbers.append(bestMatchIndex)
 
+        return numbers
 
-class Biome():
-    def __init__(self, client: default.DiscordBot):
-        self.client = client
+    def getIGT(self, frame):
+        # cv2.imshow("camCapture", frame)
+        # cv2.waitKey(1)
 
-        self.biomeID = "unknown"
+        numbers = self.read_igt(frame)
+        if numbers is None:
+            return False
 
-        self.biomeTemplate = cv2.imread("./assets/images/minecraft/Biome.png")
+        minute = numbers[0] * 10 + numbers[1]
+        second = numbers[2] * 10 + numbers[3]
+        millisecond = numbers[4] * 100 + numbers[5] * 10 + numbers[6]
+        timeIGT = datetime.time(minute=minute, second=second, microsecond=millisecond * 1000)
+        if timeIGT == self.timeIGT:
+            return False
 
-        with open("./assets/dictionaries/minecraft/biomes.json", "r", encoding="utf-8") as biomeJson:
-            biomeStr = biomeJson.read()
-            biomeData = json.loads(biomeStr)
-            biomeData["biome_text"][None] = None
+        self.timeIGT = timeIGT
+        self.pipeline.liveFeed.update(igt=self.pipeline.timeToString(self.timeIGT))
+        return True
 
-            self.biomeIDs = biomeData["biome_ids"]
-            self.biomeText = biomeData["biome_text"]
 
-        self.biomeImages = []
-        for biomeID in self.biomeIDs:
-            image = cv2.imread(f"./assets/images/minecraft/Biomes/{biomeID}.png")
-            self.biomeImages.append(image)
+class Biome():
+    MATCHER = "bgr"
 
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.matcher = get_matcher(self.MATCHER)
+
+        self.biomeID = "unknown"
+
+        self.biomeTemplate = pipeline.bank.biomeTemplate
+        self.biomeIDs = pipeline.bank.biomeIDs
+        self.biomeText = pipeline.bank.biomeText
+        self.biomeImages = pipeline.bank.biomeImages
 
     def check_biome_visible(self, frame):
         biomeText = frame[488:516, 0:83]
 
-        result = cv2.matchTemplate(biomeText, self.biomeTemplate, cv2.TM_CCOEFF_NORMED)
-        _, maxVal, _, _ = cv2.minMaxLoc(result)
+        maxVal, _ = self.matcher.match(biomeText, self.biomeTemplate)
 
         return maxVal >= 0.5
 
-    def getBiome(self):
-        while not self.client.minecraft.stopMainFlag:
-            time.sleep(1/5)
+    def read_biome(self, frame):
+        if not self.check_biome_visible(frame):
+            return None
 
-            with self.client.minecraft.lock:
-                frame = self.client.minecraft.frame
+        yStart = 489
+        xStart = 249
 
-            if frame is None:
-                continue
+        bestMatchVal = 0
+        bestMatchIndex = None
 
-            if self.check_biome_visible(frame):
-                # cv2.imshow("camCapture", frame)
-                # cv2.waitKey(1)
+        for j, template in enumerate(self.biomeImages):
+            biomeID = frame[yStart:yStart+template.shape[0], xStart:xStart+template.shape[1]]
 
-                yStart = 489
-                xStart = 249
+            maxVal, maxLoc = self.matcher.match(biomeID, template)
 
-                bestMatchVal = 0
-                bestMatchIndex = None
+            if maxVal >= 0.5 and maxLoc[0] == 0 and maxVal > bestMatchVal:
+                bestMatchVal = maxVal
+                bestMatchIndex = j
 
-                for j, template in enumerate(self.biomeImages):
-                    biomeID = frame[yStart:yStart+template.shape[0], xStart:xStart+template.shape[1]]
+        if bestMatchIndex is None:
+            return None
 
-                    result = cv2.matchTemplate(biomeID, template, cv2.TM_CCOEFF_NORMED)
-                    _, maxVal, _, maxLoc = cv2.minMaxLoc(result)
+        return self.biomeIDs[bestMatchIndex]
 
-                    if maxVal >= 0.5 and maxLoc[0] == 0 and maxVal > bestMatchVal:
-                        bestMatchVal = maxVal
-                        bestMatchIndex = j
+    def getBiome(self, frame):
+        # cv2.imshow("camCapture", frame)
+        # cv2.waitKey(1)
 
-                if bestMatchIndex is None:
-                    continue
+        biomeID = self.read_biome(frame)
+        if biomeID is None or biomeID == self.biomeID:
+            return False
 
-                self.biomeID = self.biomeIDs[bestMatchIndex]
+        self.biomeID = biomeID
+        self.pipeline.liveFeed.update(biome=self.biomeID)
+        return True
 
 
 class Achievement():
-    def __init__(self, client: default.DiscordBot):
-        self.client = client
+    MATCHER = "bgr"
 
-        self.phase = ["Start"]
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.matcher = get_matcher(self.MATCHER)
 
-        with open("./assets/dictionaries/minecraft/achievements.json", "r", encoding="utf-8") as achievementJson:
-            achievementStr = achievementJson.read()
-            achievementData = json.loads(achievementStr)
+        self.phase = ["Start"]
 
-            self.achievementPhases = achievementData["achievementPhases"]
-            self.achievementPriority = achievementData["achievementPriority"]
+        self.achievementPhases = pipeline.bank.achievementPhases
+        self.achievementPriority = pipeline.bank.achievementPriority
+        self.templates = pipeline.bank.achievementTemplates
 
-        self.templates = []
-        for phase in self.achievementPhases:
-            templatePath = f'./assets/images/minecraft/{phase}.png'
-            template = cv2.imread(templatePath)
-            self.templates.append(template)
+        self.cascade = True
+        self.gate = ColourGate(self.templates)
 
     def check_priority_phase(self, achievementMatches):
         oldPhase = self.phase[-1]
@@ -361,18 +814,22 @@ class Achievement():
 
         for match in achievementMatches:
             prio = self.achievementPriority[match]
-            if self.client.minecraft.other.isSpectator is False and prio >= highestPrio and match not in self.phase:
+            if self.pipeline.other.isSpectator is False and prio >= highestPrio and match not in self.phase:
                 self.phase.append(match)
                 highestPrio = prio
-                self.client.minecraft.coordinates.achievementCheck.append([match, 0])
-                self.client.minecraft.coordinates.all_achievementCheck.append([match, 0])
-                self.client.loop.create_task(self.pingStronghold(match, oldPhase))
+                self.pipeline.coordinates.achievementCheck.append([match, 0])
+                self.pipeline.coordinates.all_achievementCheck.append([match, 0])
+                self.pipeline.splitStats.recordSplit(match, self.pipeline.igt.timeIGT)
+                asyncio.run_coroutine_threadsafe(self.pingStronghold(match, oldPhase), self.pipeline.client.loop)
+
+        self.pipeline.liveFeed.update(phase=self.numberStructute())
 
     async def pingStronghold(self, phase, oldPhase):
-        if not self.client.isTest and (phase != oldPhase and phase == "Stronghold"):
+        client = self.pipeline.client
+        if not client.isTest and self.pipeline.isPrimary and (phase != oldPhase and phase == "Stronghold"):
             SNIPA_CHANNEL = 1081602472516276294
             PING_ROLE = 1137857293363449866
-            discordChannel = await (self.client.get_channel(SNIPA_CHANNEL) or await self.client.fetch_channel(SNIPA_CHANNEL))
+            discordChannel = await (client.get_channel(SNIPA_CHANNEL) or await client.fetch_channel(SNIPA_CHANNEL))
             await discordChannel.send(content=f"<@&{PING_ROLE}> THE RUN")
 
     def numberStructute(self):
@@ -384,64 +841,59 @@ class Achievement():
 
         return self.phase[-1]
 
-    def getAchievement(self):
-        while not self.client.minecraft.stopMainFlag:
-            time.sleep(1/5)
+    def read_achievements(self, frame):
+        achievement = frame[882:960, 461:927]
 
-            with self.client.minecraft.lock:
-                frame = self.client.minecraft.frame
+        candidates = self.gate.candidates(achievement) if self.cascade else range(len(self.templates))
 
-            if frame is None:
-                continue
+        achievementMatches = []
+        for j in candidates:
+            maxVal, _ = self.matcher.match(achievement, self.templates[j])
 
-            # cv2.imshow("camCapture", frame)
-            # cv2.waitKey(1)
+            if maxVal >= 0.5:
+                achievementMatches.append(self.achievementPhases[j])
 
-            achievement = frame[882:960, 461:927]
+        return achievementMatches
 
-            achievementMatches = []
-            for j, template in enumerate(self.templates):
-                result = cv2.matchTemplate(achievement, template, cv2.TM_CCOEFF_NORMED)
-                _, maxVal, _, _ = cv2.minMaxLoc(result)
+    def getAchievement(self, frame):
+        # cv2.imshow("camCapture", frame)
+        # cv2.waitKey(1)
 
-                if maxVal >= 0.5:
-                    achievementMatches.append(self.achievementPhases[j])
+        achievementMatches = self.read_achievements(frame)
+        if not achievementMatches:
+            return False
 
-            if not achievementMatches:
-                continue
-
-            self.check_priority_phase(achievementMatches)
+        # A toast is on screen, keep sampling fast until it is gone
+        self.check_priority_phase(achievementMatches)
+        return True
 
 
 class Coordinates():
-    def __init__(self, client: default.DiscordBot):
-        self.client = client
+    MATCHER = "bgr"
+
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.matcher = get_matcher(self.MATCHER)
         self.coordsList = []
+        self.coordsFilter = CoordinateFilter()
+        self.lock = threading.Lock() # Other resets and flushes the path from its own worker
         self.achievementCheck = [["Start", 0]] # [[phase, number_check_trueCoord]
         self.all_achievementCheck = self.achievementCheck
 
-        self.blockTemplate = cv2.imread("./assets/images/minecraft/Coordinates/Block.png")
-
-        self.templates = []
-        for i in range(10):
-            templatePath = f'./assets/images/minecraft/Coordinates/{i}.png'
-            template = cv2.imread(templatePath)
-            self.templates.append(template)
-
-        self.templates.append(cv2.imread("./assets/images/minecraft/Coordinates/minus.png"))
+        self.blockTemplate = pipeline.bank.blockTemplate
+        self.templates = pipeline.bank.coordTemplates
 
     def check_block_visible(self, frame):
         blockText = frame[303:324, 6:81]
 
-        result = cv2.matchTemplate(blockText, self.blockTemplate, cv2.TM_CCOEFF_NORMED)
-        _, maxVal, _, _ = cv2.minMaxLoc(result)
+        maxVal, _ = self.matcher.match(blockText, self.blockTemplate)
 
         return maxVal >= 0.5
-    
+
     def get_coord_numbers(self, coords):
         numbers = []
         for i, template in enumerate(self.templates):
-            result = cv2.matchTemplate(coords, template, cv2.TM_CCOEFF_NORMED)
+            result = self.matcher.scores(coords, template)
             threshold = 0.8
             locations = np.where(result >= threshold)
 
@@ -469,10 +921,10 @@ class Coordinates():
                     numbers.append((x, "-", maxVal))
                 else:
                     numbers.append((x, i, maxVal))
-                    
+
         return numbers
-    
-    def append_coord_numbers(self, numbers):
+
+    def parse_coord_numbers(self, numbers):
         sortedNumbers = sorted(numbers, key=lambda x: x[0])
 
         coordString = ""
@@ -492,228 +944,266 @@ class Coordinates():
             coordString += str(number)
         try:
             coords.append(int(coordString))
-            self.coordsList.append(coords)
-            numbers = np.array(self.coordsList)
-            return numbers
-        except Exception as e:
-            print(e)
+        except ValueError:
             return None
 
-    def remove_outlier_coords(self, numbers):
-        diffs = np.diff(numbers, axis=0)
-        threshold = 10
-        distances = np.linalg.norm(diffs, axis=1)
-    
-        outlierIndices = [
-            i - 1
-            for i, distance in enumerate(distances[-2:])
-            if distances[-2:][i-1] > threshold and distance > threshold
-        ]
+        if len(coords) != 3:
+            return None
 
-        for row in outlierIndices:
-            self.coordsList.pop(len(self.coordsList)-2+row)
-            if self.achievementCheck[-1][1] >= 0:
-                self.achievementCheck[-1][1] -= 1
+        return coords
 
-        if len(self.coordsList) >= 2 and (len(self.achievementCheck) > 0 and len(self.achievementCheck[-1]) < 3):
-            if self.achievementCheck[-1][1] == 1:
-                self.achievementCheck[-1].append(self.coordsList[-2:][0])
-                self.achievementCheck[-1][1] = -1
-        
-            elif self.achievementCheck[-1][1] == 0:
-                self.achievementCheck[-1][1] += 1
+    def reset_path(self):
+        with self.lock:
+            self.coordsList = []
+            self.coordsFilter.reset()
 
-    def getCoords(self):
-        while not self.client.minecraft.stopMainFlag:
-            time.sleep(1/5)
+    def estimate(self):
+        with self.lock:
+            return self.coordsFilter.estimate(time.monotonic())
 
-            with self.client.minecraft.lock:
-                frame = self.client.minecraft.frame
+    def dimension(self):
+        phase = self.pipeline.achievement.phase[-1]
+        if phase in ("Nether", "Bastion", "Fortress"):
+            return "nether"
+        if phase == "End":
+            return "end"
+        return "overworld"
 
-            if frame is None:
-                continue
+    def flush_heatmap(self):
+        with self.lock:
+            path = list(self.coordsList)
+            pois = [(phaseCoords[0], phaseCoords[2]) for phaseCoords in self.achievementCheck if phaseCoords[1] == -1 and len(phaseCoords) >= 3]
 
-            if self.check_block_visible(frame):
-                coords = frame[302:325, 101:385]
+        try:
+            self.pipeline.spatialHeatmap.addVisit(self.dimension(), path, pois)
+        except Exception as e:
+            print(e)
 
-                lowerBound = np.array([170, 170, 170], dtype=np.uint8)
-                upperBound = np.array([255, 255, 255], dtype=np.uint8)
-                mask = cv2.inRange(coords, lowerBound, upperBound)
-                coords = cv2.bitwise_and(coords, coords, mask=mask)
+    def pin_poi(self, coords):
+        # Accepted reads are within a speed bound of a live track, or agreed on by several reads after a gap, so the first one after an achievement is pinned
+        if len(self.achievementCheck) > 0 and len(self.achievementCheck[-1]) < 3:
+            self.achievementCheck[-1].append(coords)
+            self.achievementCheck[-1][1] = -1
 
-                numbers = self.get_coord_numbers(coords)
-                if not numbers:
-                    continue
+    def read_coord_numbers(self, frame):
+        if not self.check_block_visible(frame):
+            return []
 
-                numbers = self.append_coord_numbers(numbers)
-                    
-                try:
-                    self.remove_outlier_coords(numbers)
-                except Exception as e:
-                    print(e)
+        coords = frame[302:325, 101:385]
 
+        lowerBound = np.array([170, 170, 170], dtype=np.uint8)
+        upperBound = np.array([255, 255, 255], dtype=np.uint8)
+        mask = cv2.inRange(coords, lowerBound, upperBound)
+        coords = cv2.bitwise_and(coords, coords, mask=mask)
 
-# class Inventory():
-#     def __init__(self, client: default.DiscordBot):
-#         self.client = client
+        return self.get_coord_numbers(coords)
 
-#         self.craftingTemplate = cv2.imread('./assets/images/minecraft/CraftingNew.png')
+    def getCoords(self, frame):
+        numbers = self.read_coord_numbers(frame)
+        if not numbers:
+            return False
 
-#         with open("./assets/dictionaries/minecraft/inventory.json", "r", encoding="utf-8") as inventoryJson:
-#             inventoryStr = inventoryJson.read()
-#             inventoryData = json.loads(inventoryStr)
+        coords = self.parse_coord_numbers(numbers)
+        if coords is None:
+            return False
 
-#             self.inventoryItems = inventoryData["inventoryItems"]
+        with self.lock:
+            if not self.coordsFilter.update(coords, time.monotonic()):
+                return False
 
-#         self.itemTemplates = []
-#         for item in self.inventoryItems:
-#             templatePath = f'./assets/images/minecraft/InventoryIcons/{item}.png'
-#             template = cv2.imread(templatePath)
-#             self.itemTemplates.append(template)
+            moved = not self.coordsList or self.coordsList[-1] != coords
 
-#     def check_inventory_visible(self, frame):
-#         crafting = frame[309:333, 987:1107]
+            self.coordsList.append(coords)
+            self.pin_poi(coords)
 
-#         # cv2.imshow("camCapture", crafting)
-#         # cv2.waitKey(1)
+        self.pipeline.liveFeed.update(coords=coords)
+        return moved
 
-#         result = cv2.matchTemplate(crafting, self.craftingTemplate, cv2.TM_CCOEFF_NORMED)
-#         _, maxVal, _, _ = cv2.minMaxLoc(result)
 
-#         return maxVal >= 0.5
+class Inventory():
+    MATCHER = "bgr"
 
-#     def getInventory(self):
-#         while not self.client.minecraft.stopMainFlag:
-#             time.sleep(1/20)
+    GRID = (540, 768, 717, 1203)
+    SLOT_ROWS = (3, 57, 111, 177) # The hotbar sits 12px lower than the main inventory
+    SLOT_COLUMNS = tuple(3 + 54 * column for column in range(9))
 
-#             with self.client.minecraft.lock:
-#                 frame = self.client.minecraft.frame
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.matcher = get_matcher(self.MATCHER)
 
-#             if frame is None:
-#                 continue
+        self.counts = {}
 
-#             # cv2.imshow("camCapture", frame)
-#             # cv2.waitKey(1)
+        self.craftingTemplate = pipeline.bank.craftingTemplate
+        self.inventoryItems = pipeline.bank.inventoryItems
+        self.classifier = TileClassifier(pipeline.bank.itemTemplates)
+        self.digitTemplates = pipeline.bank.coordTemplates[:10] # Stack counts use the same font as the F3 screen
 
-#             isVisible = self.check_inventory_visible(frame)
+    def check_inventory_visible(self, frame):
+        crafting = frame[309:333, 987:1107]
 
-#             if isVisible:
-#                 print("Visible")
+        maxVal, _ = self.matcher.match(crafting, self.craftingTemplate)
 
-#                 xStart = 3
-#                 yStart = 3
+        return maxVal >= 0.5
 
-#                 inventory = frame[540:768, 717:1203]
+    def slot_tiles(self, grid):
+        tileHeight, tileWidth = self.classifier.shape
+
+        # Every tile-sized window of the grid is a view, the 36 slots are picked out of it in one gather
+        windows = np.lib.stride_tricks.sliding_window_view(grid, (tileHeight, tileWidth), axis=(0, 1))
+        tiles = windows[np.ix_(self.SLOT_ROWS, self.SLOT_COLUMNS)]
+        return tiles.reshape(-1, 3, tileHeight, tileWidth).transpose(0, 2, 3, 1)
+
+    def read_stack_count(self, grid, row: int, column: int):
+        # The count sits under the icon tile in the bottom right corner and overhangs the slot by a few pixels
+        yStart = self.SLOT_ROWS[row] + 24
+        xStart = self.SLOT_COLUMNS[column]
+        corner = grid[yStart:yStart+27, xStart:xStart+54]
+
+        lowerBound = np.array([170, 170, 170], dtype=np.uint8)
+        upperBound = np.array([255, 255, 255], dtype=np.uint8)
+        mask = cv2.inRange(corner, lowerBound, upperBound)
+        corner = cv2.bitwise_and(corner, corner, mask=mask)
+
+        found = []
+        for number, template in enumerate(self.digitTemplates):
+            result = self.matcher.scores(corner, template)
+            for y, x in zip(*np.where(result >= 0.8)):
+                found.append((float(result[y, x]), int(x), number))
+
+        digits = []
+        for score, x, number in sorted(found, reverse=True):
+            if all(abs(x - digitX) >= 9 for digitX, _ in digits):
+                digits.append((x, number))
+
+        if not digits:
+            return 1 # A single item has no count drawn
+        return int("".join(str(number) for _, number in sorted(digits)))
+
+    def read_inventory(self, frame):
+        if not self.check_inventory_visible(frame):
+            return None
 
-#                 for i in range(9*4):
-#                     item = inventory[yStart:yStart+27, xStart:xStart+48]
+        y1, y2, x1, x2 = self.GRID
+        grid = frame[y1:y2, x1:x2]
 
-#                     for itemTemplate in self.itemTemplates:
-#                         result = cv2.matchTemplate(item, itemTemplate, cv2.TM_CCOEFF_NORMED)
-#                         _, maxVal, _, _ = cv2.minMaxLoc(result)
+        counts = {}
+        for slot, itemIndex in enumerate(self.classifier.classify(self.slot_tiles(grid))):
+            if itemIndex >= 0:
+                item = self.inventoryItems[itemIndex]
+                counts[item] = counts.get(item, 0) + self.read_stack_count(grid, slot // 9, slot % 9)
 
-#                         if maxVal >= 0.95:
-#                             cv2.imshow("camCapture", item)
-#                             cv2.waitKey(0)
+        return counts
 
-#                             cv2.imshow("camCapture", itemTemplate)
-#                             cv2.waitKey(0)
+    def countsToString(self):
+        if not self.counts:
+            return "Nothing seen"
 
-#                     xStart += 48 + 6
+        return "\n".join(f"{item}: {count}" for item, count in self.counts.items())
 
-#                     if (i+1) % 9 == 0:
-#                         yStart += 48 + 6
-#                         xStart = 3
+    def getInventory(self, frame):
+        counts = self.read_inventory(frame)
+        if counts is None or counts == self.counts:
+            return False
 
-#                         if (i+1) == 27:
-#                             yStart += 12
+        self.counts = counts
+        self.pipeline.liveFeed.update(inventory=self.counts)
+        return True
 
 
 class Other():
-    def __init__(self, client: default.DiscordBot):
-        self.client = client
-        
+    MATCHER = "bgr"
+
+    def __init__(self, pipeline: Pipeline):
+        self.pipeline = pipeline
+        self.matcher = get_matcher(self.MATCHER)
+
         self.resultTemplate = None
         self.deathCounter = 0
         self.generatingCounter = 0
         self.isSpectator = False
 
-        self.otherTemplates = (("Loading", (390, 414, 771, 1056), 0.5), ("Generating", (438, 459, 942, 975), 0.85),
-                               ("Died", (504, 528, 855, 1062), 0.3), ("Spectator", (555, 576, 879, 1038), 0.4))
-        self.templates = []
-        for templateText, _, _ in self.otherTemplates:
-            templatePath = f'./assets/images/minecraft/{templateText}.png'
-            template = cv2.imread(templatePath)
-            self.templates.append(template)
-
-    def loading(self, minecraft: Minecraft):
-        minecraft.coordinates.coordsList = []
-        minecraft.coordinates.achievementCheck = []
-        if all(phase in minecraft.achievement.phase for phase in ["Bastion", "Fortress"]):
-            if "Nether Exit" not in minecraft.achievement.phase:
-                minecraft.achievement.phase.append("Nether Exit")
-                minecraft.coordinates.achievementCheck = [["Nether Exit", 0]]
-                minecraft.coordinates.all_achievementCheck.append(["Nether Exit", 0])
-            elif "Nether Exit" in minecraft.coordinates.all_achievementCheck[-1]:
-                minecraft.coordinates.achievementCheck = [minecraft.coordinates.all_achievementCheck[-2]]
-
-    def generating(self, minecraft: Minecraft):
+        self.otherTemplates = pipeline.bank.otherTemplates
+        self.templates = pipeline.bank.otherImages
+
+        self.cascade = True
+        self.gate = ColourGate(self.templates)
+
+    def loading(self, pipeline: Pipeline):
+        pipeline.coordinates.flush_heatmap()
+        pipeline.coordinates.reset_path()
+        pipeline.coordinates.achievementCheck = []
+        if all(phase in pipeline.achievement.phase for phase in ["Bastion", "Fortress"]):
+            if "Nether Exit" not in pipeline.achievement.phase:
+                pipeline.achievement.phase.append("Nether Exit")
+                pipeline.coordinates.achievementCheck = [["Nether Exit", 0]]
+                pipeline.coordinates.all_achievementCheck.append(["Nether Exit", 0])
+                pipeline.splitStats.recordSplit("Nether Exit", pipeline.igt.timeIGT)
+            elif "Nether Exit" in pipeline.coordinates.all_achievementCheck[-1]:
+                pipeline.coordinates.achievementCheck = [pipeline.coordinates.all_achievementCheck[-2]]
+
+    def generating(self, pipeline: Pipeline):
         self.generatingCounter += 1
-        minecraft.igt.timeIGT = datetime.time(minute=0, second=0, microsecond=0)
-        minecraft.biome.biomeID = "unknown"
-        minecraft.achievement.phase = ["Start"]
-        minecraft.coordinates.coordsList = []
-        minecraft.coordinates.achievementCheck = [["Start", 0]]
-        minecraft.coordinates.all_achievementCheck = [["Start", 0]]
+        pipeline.splitStats.endRun()
+        pipeline.splitStats.startRun()
+        pipeline.coordinates.flush_heatmap()
+        pipeline.igt.timeIGT = datetime.time(minute=0, second=0, microsecond=0)
+        pipeline.biome.biomeID = "unknown"
+        pipeline.achievement.phase = ["Start"]
+        pipeline.coordinates.reset_path()
+        pipeline.coordinates.achievementCheck = [["Start", 0]]
+        pipeline.coordinates.all_achievementCheck = [["Start", 0]]
         self.isSpectator = False
 
     def death(self):
         self.deathCounter += 1
+        self.pipeline.splitStats.recordDeath()
 
     def spectator(self):
         self.isSpectator = True
 
-    def getOthers(self):
-        minecraft = self.client.minecraft
-        while not minecraft.stopMainFlag:
-            time.sleep(1/30)
+    def read_other(self, frame):
+        for j, template in enumerate(self.templates):
+            otherTemplate = self.otherTemplates[j][1]
+            otherTemplate = frame[otherTemplate[0]:otherTemplate[1], otherTemplate[2]:otherTemplate[3]]
 
-            with minecraft.lock:
-                frame = minecraft.frame
-
-            if frame is None:
+            if self.cascade and not self.gate.passes(otherTemplate, j):
                 continue
 
-            # cv2.imshow("camCapture", frame)
-            # cv2.waitKey(1)
+            maxVal, _ = self.matcher.match(otherTemplate, template)
 
-            newResultTemplate = None
-            for j, template in enumerate(self.templates):
-                otherTemplate = self.otherTemplates[j][1]
-                otherTemplate = frame[otherTemplate[0]:otherTemplate[1], otherTemplate[2]:otherTemplate[3]]
+            if maxVal >= self.otherTemplates[j][2]:
+                return self.otherTemplates[j][0]
 
-                result = cv2.matchTemplate(otherTemplate, template, cv2.TM_CCOEFF_NORMED)
-                _, maxVal, _, _ = cv2.minMaxLoc(result)
+        return None
 
-                if maxVal >= self.otherTemplates[j][2]:
-                    newResultTemplate = self.otherTemplates[j][0]
-                    break
+    def getOthers(self, frame):
+        pipeline = self.pipeline
 
-            if newResultTemplate != self.resultTemplate:
-                self.resultTemplate = newResultTemplate
+        # cv2.imshow("camCapture", frame)
+        # cv2.waitKey(1)
 
-                if self.resultTemplate is None:
-                    continue
+        newResultTemplate = self.read_other(frame)
+
+        if newResultTemplate == self.resultTemplate:
+            return False
+
+        self.resultTemplate = newResultTemplate
+
+        if self.resultTemplate is None:
+            return True
+
+        match newResultTemplate:
+            case "Loading":
+                self.loading(pipeline)
+            case "Generating":
+                self.generating(pipeline)
+            case "Died":
+                self.death()
+            case "Spectator":
+                self.spectator()
 
-                match newResultTemplate:
-                    case "Loading":
-                        self.loading(minecraft)
-                    case "Generating":
-                        self.generating(minecraft)
-                    case "Died":
-                        self.death()
-                    case "Spectator":
-                        self.spectator()
+        pipeline.liveFeed.update(**pipeline.liveState())
+        return True
 
 
 async def setup(client: default.DiscordBot):
@@ -1,3 +1,8 @@
+import io
+import time
+
+import discord
+
 from discord.ext import commands
 
 from dotenv import load_dotenv
@@ -17,5 +22,21 @@ class Misc_Commands(commands.Cog):
             await self.client.minecraft.stopMain()
             await self.client.close()
 
+    @commands.hybrid_command(aliases=["prof"], description="Profiles the bot threads")
+    async def profile(self, ctx: commands.Context, seconds: float = 30):
+        if ctx.author.id == self.client.DEV.id:
+            seconds = max(1, min(seconds, self.client.profiler.MAX_SECONDS))
+            await ctx.send(f"Profiling for {seconds:g}s")
+
+            try:
+                report, samples = await self.client.profiler.profile_summary(seconds)
+            except RuntimeError as e:
+                await default.embedMessage(client=self.client, ctx=ctx, description=str(e))
+                return
+
+            summary = "\n".join(f"{label}: {count}" for label, count in samples.most_common(15))
+            image = discord.File(io.BytesIO(report.encode()), filename=f"profile-{int(time.time())}.folded")
+            await ctx.send(content=f"Samples per thread:\n```{summary or 'None'}```", file=image)
+
 async def setup(client: default.DiscordBot):
     await client.add_cog(Misc_Commands(client))
@@ -32,12 +32,4 @@ def main():
     loop.run_forever()
 
 if __name__ == "__main__":
-    # yappi.start()
     main()
-    # yappi.stop()
-    # threads = yappi.get_thread_stats()
-    # for thread in threads:
-    #     print(
-    #         "Function stats for (%s) (%d)" % (thread.name, thread.id)
-    #     )  # it is the Thread.__class__.__name__
-    #     yappi.get_func_stats(ctx_id=thread.id).print_all()
@@ -0,0 +1,141 @@
+import io
+import os
+import json
+import time
+import asyncio
+import hashlib
+
+import discord
+
+from urllib.parse import urlparse, parse_qs
+
+
+class AttachmentCache():
+    # Every image is uploaded once to a private channel; embeds reuse its CDN url, keyed by the sha256 of the bytes
+    # Least recently used entries past MAX_ENTRIES are forgotten; their uploads stay, embeds already posted still point at them
+    CACHE_PATH = "./data/attachments.json"
+    EXPIRY_MARGIN = 60 * 60
+    MAX_ENTRIES = 256
+
+    def __init__(self, client, channelID: int = None):
+        self.client = client
+        self.channelID = channelID
+        self.channel = None
+
+        self.entries = {}
+        self.fileHashes = {}
+        self.locks = {}
+
+        self.uploads = 0
+        self.hits = 0
+
+        if os.path.exists(self.CACHE_PATH):
+            with open(self.CACHE_PATH, "r", encoding="utf-8") as cacheJson:
+                self.entries = json.loads(cacheJson.read())
+
+    @property
+    def enabled(self):
+        return self.channelID is not None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.CACHE_PATH), exist_ok=True)
+        tempPath = f"{self.CACHE_PATH}.tmp"
+        with open(tempPath, "w", encoding="utf-8") as cacheJson:
+            json.dump(self.entries, cacheJson)
+        os.replace(tempPath, self.CACHE_PATH)
+
+    @staticmethod
+    def expires(url: str):
+        # Discord signs CDN urls, ex is the hex unix time the signature stops working
+        expiry = parse_qs(urlparse(url).query).get("ex")
+        if not expiry:
+            return None
+        return int(expiry[0], 16)
+
+    def fresh(self, entry: dict):
+        expiry = entry.get("expires")
+        return expiry is None or expiry - self.EXPIRY_MARGIN > time.time()
+
+    async def get_channel(self):
+        if self.channel is None:
+            self.channel = self.client.get_channel(self.channelID) or await self.client.fetch_channel(self.channelID)
+        return self.channel
+
+    def touch(self, digest: str):
+        self.entries[digest] = self.entries.pop(digest)
+
+    def prune(self):
+        while len(self.entries) > self.MAX_ENTRIES:
+            digest = next(iter(self.entries))
+            self.entries.pop(digest)
+            lock = self.locks.get(digest)
+            if lock is not None and not lock.locked():
+                del self.locks[digest]
+
+    def store(self, digest: str, message: discord.Message):
+        url = message.attachments[0].url
+        self.entries.pop(digest, None)
+        self.entries[digest] = {"url": url, "messageID": message.id, "expires": self.expires(url)}
+        self.prune()
+        self.save()
+        return url
+
+    async def refresh(self, digest: str):
+        # Fetching the upload again returns a newly signed url, so expired entries never need the bytes re-sent
+        entry = self.entries.get(digest)
+        if entry is None:
+            return None
+
+        channel = await self.get_channel()
+        try:
+            message = await channel.fetch_message(entry["messageID"])
+        except discord.NotFound:
+            return None
+
+        if not message.attachments:
+            return None
+        return self.store(digest, message)
+
+    async def url(self, data: bytes, filename: str):
+        if not self.enabled:
+            return None
+
+        digest = hashlib.sha256(data).hexdigest()
+        lock = self.locks.setdefault(digest, asyncio.Lock())
+        async with lock:
+            entry = self.entries.get(digest)
+            if entry is not None:
+                self.hits += 1
+                self.touch(digest)
+                if self.fresh(entry):
+                    return entry["url"]
+
+                url = await self.refresh(digest)
+                if url is not None:
+                    return url
+
+            channel = await self.get_channel()
+            message = await channel.send(content=digest, file=discord.File(io.BytesIO(data), filename=filename))
+            self.uploads += 1
+            return self.store(digest, message)
+
+    async def file_url(self, path: str):
+        # Static assets are hashed once per process, they do not change while the bot runs
+        if not self.enabled:
+            return None
+
+        digest = self.fileHashes.get(path)
+        entry = self.entries.get(digest) if digest is not None else None
+        if entry is not None and self.fresh(entry):
+            self.hits += 1
+            self.touch(digest)
+            return entry["url"]
+
+        data = await asyncio.to_thread(self.read_file, path)
+        self.fileHashes[path] = hashlib.sha256(data).hexdigest()
+        return await self.url(data, os.path.basename(path))
+
+    @staticmethod
+    def read_file(path: str):
+        with open(path, "rb") as file:
+            return file.read()
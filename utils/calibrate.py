@@ -0,0 +1,165 @@
+import os
+import sys
+import time
+import argparse
+
+import cv2
+
+from types import SimpleNamespace
+
+from cogs.minecraft import TemplateBank, IGT, Biome, Achievement, Coordinates, Inventory, Other
+from utils.matching import MATCHERS
+
+# Every backend is compared against the full BGR path, which is what the thresholds were tuned on
+DETECTORS = {
+    "IGT": (IGT, "read_igt"),
+    "Biome": (Biome, "read_biome"),
+    "Achievement": (Achievement, "read_achievements"),
+    "Coordinates": (Coordinates, "read_coord_numbers"),
+    "Inventory": (Inventory, "read_inventory"),
+    "Other": (Other, "read_other"),
+}
+
+
+def load_frames(source: str, step: int, limit: int):
+    if os.path.isdir(source):
+        for file in sorted(os.listdir(source))[::step][:limit]:
+            frame = cv2.imread(os.path.join(source, file))
+            if frame is not None:
+                yield frame
+        return
+
+    cap = cv2.VideoCapture(source)
+    index = 0
+    count = 0
+    while count < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        if index % step == 0:
+            count += 1
+            yield frame
+        index += 1
+    cap.release()
+
+
+def normalize(output):
+    if isinstance(output, list) and output and isinstance(output[0], tuple):
+        return sorted((x, number) for x, number, _ in output)
+    return output
+
+
+def calibrate(frames: list, detectors: list, backends: list):
+    pipeline = SimpleNamespace(bank=TemplateBank())
+    report = []
+
+    for detectorName in detectors:
+        detectorClass, readName = DETECTORS[detectorName]
+        detector = detectorClass(pipeline)
+        read = getattr(detector, readName)
+
+        detector.matcher = MATCHERS["bgr"]
+        reference = [normalize(read(frame)) for frame in frames]
+
+        for backend in backends:
+            detector.matcher = MATCHERS[backend]
+
+            agree = 0
+            hits = 0
+            hitAgree = 0
+            elapsed = 0.0
+            for frame, expected in zip(frames, reference):
+                start = time.perf_counter()
+                output = normalize(read(frame))
+                elapsed += time.perf_counter() - start
+
+                agree += output == expected
+                if expected:
+                    hits += 1
+                    hitAgree += output == expected
+
+            report.append({
+                "detector": detectorName,
+                "backend": backend,
+                "agreement": agree / len(frames),
+                "recall": hitAgree / hits if hits else None,
+                "ms": elapsed / len(frames) * 1000,
+            })
+
+    return report
+
+
+def calibrate_cascade(frames: list):
+    pipeline = SimpleNamespace(bank=TemplateBank())
+    report = []
+
+    for detectorName in ("Achievement", "Other"):
+        detectorClass, readName = DETECTORS[detectorName]
+        detector = detectorClass(pipeline)
+        read = getattr(detector, readName)
+
+        results = {}
+        for cascade in (False, True):
+            detector.cascade = cascade
+
+            outputs = []
+            start = time.perf_counter()
+            for frame in frames:
+                outputs.append(read(frame))
+            results[cascade] = (outputs, (time.perf_counter() - start) / len(frames) * 1000)
+
+        (expected, fullMs), (outputs, cascadeMs) = results[False], results[True]
+        truePositives = sum(1 for output, reference in zip(outputs, expected) if output and output == reference)
+        positives = sum(1 for reference in expected if reference)
+        predicted = sum(1 for output in outputs if output)
+
+        report.append({
+            "detector": detectorName,
+            "precision": truePositives / predicted if predicted else None,
+            "recall": truePositives / positives if positives else None,
+            "positives": positives,
+            "fullMs": fullMs,
+            "cascadeMs": cascadeMs,
+        })
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare template matching backends per detector against the BGR path")
+    parser.add_argument("source", help="Video file or directory of 1080p frames")
+    parser.add_argument("--step", type=int, default=30, help="Use every Nth frame")
+    parser.add_argument("--limit", type=int, default=500, help="Maximum number of frames")
+    parser.add_argument("--detectors", nargs="+", default=list(DETECTORS), choices=list(DETECTORS))
+    parser.add_argument("--backends", nargs="+", default=list(MATCHERS), choices=list(MATCHERS))
+    parser.add_argument("--cascade", action="store_true", help="Report the colour gate cascade against the full match path instead")
+    args = parser.parse_args()
+
+    frames = list(load_frames(args.source, args.step, args.limit))
+    if not frames:
+        print("No frames found")
+        sys.exit(1)
+
+    if args.cascade:
+        print(f"{len(frames)} frames")
+        print(f"{'Detector':<12} {'Precision':>10} {'Recall':>8} {'Positives':>10} {'Full ms':>8} {'Cascade ms':>11}")
+        for row in calibrate_cascade(frames):
+            precision = "-" if row["precision"] is None else f"{row['precision']:.1%}"
+            recall = "-" if row["recall"] is None else f"{row['recall']:.1%}"
+            print(f"{row['detector']:<12} {precision:>10} {recall:>8} {row['positives']:>10} {row['fullMs']:>8.3f} {row['cascadeMs']:>11.3f}")
+        return
+
+    report = calibrate(frames, args.detectors, args.backends)
+
+    baseline = {row["detector"]: row["ms"] for row in report if row["backend"] == "bgr"}
+    print(f"{len(frames)} frames")
+    print(f"{'Detector':<12} {'Backend':<8} {'Agreement':>10} {'Recall':>8} {'ms/frame':>9} {'Speedup':>8}")
+    for row in report:
+        recall = "-" if row["recall"] is None else f"{row['recall']:.1%}"
+        speedup = baseline.get(row["detector"], row["ms"]) / row["ms"] if row["ms"] else 0
+        print(f"{row['detector']:<12} {row['backend']:<8} {row['agreement']:>10.1%} {recall:>8} {row['ms']:>9.3f} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -42,6 +42,15 @@ class DiscordBot(Bot):
         
         from cogs.minecraft import Minecraft
         self.minecraft:Minecraft = self.get_cog("Minecraft")
+        self.app.config['MINECRAFT'] = self.minecraft
+
+        from utils.attachments import AttachmentCache
+        assetChannel = os.environ.get("ASSET_CHANNEL_ID")
+        self.attachments = AttachmentCache(client=self, channelID=int(assetChannel) if assetChannel else None)
+
+        from utils.profiler import SamplingProfiler
+        self.profiler = SamplingProfiler(labeler=self.minecraft.scheduler.label)
+        self.app.config['PROFILER'] = self.profiler
 
         from utils.twitchAPI import TwitchAPI
         self.twitchAPI = TwitchAPI(client=self, loop=self.loop)
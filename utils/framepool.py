@@ -0,0 +1,95 @@
+import threading
+import contextlib
+
+import numpy as np
+
+
+class FrameBuffer():
+    __slots__ = ("array", "refs")
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.refs = 0
+
+
+class FramePool():
+    # The capture decodes into a free buffer and swaps it in as current; a buffer is only reused once nobody holds it
+    def __init__(self, size: int):
+        self.size = size
+        self.lock = threading.Lock()
+
+        self.buffers: list[FrameBuffer] = []
+        self.current: FrameBuffer = None
+        self.shape = None
+
+        self.allocations = 0
+        self.published = 0
+        self.dropped = 0
+        self.borrows = 0
+
+    def allocate(self, shape: tuple, dtype):
+        with self.lock:
+            if self.current is not None:
+                self.current.refs -= 1
+                self.current = None
+
+            self.buffers = [FrameBuffer(np.empty(shape, dtype=dtype)) for _ in range(self.size)]
+            self.shape = shape
+            self.allocations += self.size
+
+    def acquire(self):
+        with self.lock:
+            for buffer in self.buffers:
+                if buffer.refs == 0:
+                    buffer.refs = 1
+                    return buffer
+
+            self.dropped += 1
+            return None
+
+    def publish(self, buffer: FrameBuffer):
+        with self.lock:
+            previous = self.current
+            self.current = buffer
+            self.published += 1
+
+            if previous is not None:
+                previous.refs -= 1
+
+    def discard(self, buffer: FrameBuffer):
+        with self.lock:
+            buffer.refs -= 1
+
+    def clear(self):
+        with self.lock:
+            if self.current is not None:
+                self.current.refs -= 1
+                self.current = None
+
+    @contextlib.contextmanager
+    def borrow(self):
+        with self.lock:
+            buffer = self.current
+            if buffer is not None:
+                buffer.refs += 1
+                self.borrows += 1
+
+        try:
+            yield None if buffer is None else buffer.array
+        finally:
+            if buffer is not None:
+                with self.lock:
+                    buffer.refs -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "shape": self.shape,
+                "inUse": sum(1 for buffer in self.buffers if buffer.refs > 0),
+                "allocations": self.allocations,
+                "published": self.published,
+                "dropped": self.dropped,
+                "borrows": self.borrows,
+                "megabytes": sum(buffer.array.nbytes for buffer in self.buffers) / 1024 / 1024,
+            }
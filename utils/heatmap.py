@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import threading
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from matplotlib.colors import LogNorm
+
+
+class SpatialHeatmap():
+    # Sparse grids keyed by (dimension, kind, cell size); positions are relative to where the dimension was entered
+    # Saving happens on a writer thread at most every SAVE_INTERVAL seconds, the detector only copies the grids it changed
+    CELL_SIZES = (8, 32, 128, 512)
+    PATH = "Path"
+    SAVE_INTERVAL = 30
+
+    def __init__(self, path: str = "./data/heatmap.json"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.saveLock = threading.Lock()
+        self.grids: dict[tuple, dict[tuple, int]] = {}
+        self.visits = {}
+
+        self.load()
+
+        self.dirty = threading.Event()
+        self.writer = threading.Thread(target=self.write_loop, name="Heatmap", daemon=True)
+        self.writer.start()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as heatmapJson:
+            heatmapData = json.loads(heatmapJson.read())
+
+        self.visits = heatmapData["visits"]
+        for grid in heatmapData["grids"]:
+            key = (grid["dimension"], grid["kind"], grid["cellSize"])
+            self.grids[key] = {(cellX, cellZ): count for cellX, cellZ, count in grid["cells"]}
+
+    def save(self):
+        # Only the dict copies are taken under the lock, serializing and writing happen outside it
+        with self.saveLock:
+            with self.lock:
+                visits = dict(self.visits)
+                grids = {key: dict(cells) for key, cells in self.grids.items()}
+
+            self.write(visits, grids)
+
+    def write(self, visits: dict, grids: dict):
+        heatmapData = {
+            "visits": visits,
+            "grids": [
+                {
+                    "dimension": dimension,
+                    "kind": kind,
+                    "cellSize": cellSize,
+                    "cells": [[cellX, cellZ, count] for (cellX, cellZ), count in cells.items()],
+                }
+                for (dimension, kind, cellSize), cells in grids.items()
+            ],
+        }
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tempPath = f"{self.path}.tmp"
+        with open(tempPath, "w", encoding="utf-8") as heatmapJson:
+            json.dump(heatmapData, heatmapJson)
+        os.replace(tempPath, self.path)
+
+    def write_loop(self):
+        while True:
+            self.dirty.wait()
+            self.dirty.clear()
+
+            try:
+                self.save()
+            except OSError as e:
+                print(e)
+
+            time.sleep(self.SAVE_INTERVAL)
+
+    def add_points(self, dimension: str, kind: str, points: np.ndarray):
+        for cellSize in self.CELL_SIZES:
+            cells = np.floor_divide(points, cellSize).astype(np.int64)
+            uniqueCells, counts = np.unique(cells, axis=0, return_counts=True)
+
+            grid = self.grids.setdefault((dimension, kind, cellSize), {})
+            for (cellX, cellZ), count in zip(uniqueCells.tolist(), counts.tolist()):
+                grid[(cellX, cellZ)] = grid.get((cellX, cellZ), 0) + count
+
+    def addVisit(self, dimension: str, path: list, pois: list):
+        if not path:
+            return
+
+        coords = np.array(path, dtype=np.float64)
+        origin = coords[0, [0, 2]]
+
+        with self.lock:
+            self.visits[dimension] = self.visits.get(dimension, 0) + 1
+            self.add_points(dimension, self.PATH, coords[:, [0, 2]] - origin)
+
+            for phase, poiCoords in pois:
+                poi = np.array([[poiCoords[0], poiCoords[2]]], dtype=np.float64) - origin
+                self.add_points(dimension, phase, poi)
+
+        self.dirty.set()
+
+    @staticmethod
+    def weighted_percentiles(values: np.ndarray, weights: np.ndarray, quantiles: tuple):
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.array(quantiles) * cumulative[-1])
+        return values[order][np.minimum(positions, len(values) - 1)]
+
+    def render_window(self, dimension: str, coverage: float = 0.99):
+        # Window in blocks around the entry that holds most samples, so a few glitched far reads cannot stretch the map
+        grid = self.grids.get((dimension, self.PATH, self.CELL_SIZES[0]))
+        if not grid:
+            return None
+
+        cellSize = self.CELL_SIZES[0]
+        cells = np.array(list(grid.keys()), dtype=np.float64)
+        counts = np.array(list(grid.values()), dtype=np.float64)
+        tail = (1 - coverage) / 2
+
+        low = np.zeros(2)
+        high = np.zeros(2)
+        for axis in range(2):
+            axisLow, axisHigh = self.weighted_percentiles(cells[:, axis], counts, (tail, 1 - tail))
+            low[axis] = min(axisLow * cellSize, 0)
+            high[axis] = max((axisHigh + 1) * cellSize, 0)
+        return low, high
+
+    def pick_cell_size(self, dimension: str, maxCells: int):
+        window = self.render_window(dimension)
+        if window is None:
+            return None, None
+
+        low, high = window
+        for cellSize in self.CELL_SIZES:
+            lowCells = np.floor(low / cellSize).astype(np.int64)
+            highCells = np.ceil(high / cellSize).astype(np.int64) - 1
+            if (highCells - lowCells + 1).max() <= maxCells:
+                return cellSize, (lowCells, highCells)
+
+        # Still too wide at the coarsest size, keep maxCells cells centred on the entry
+        half = maxCells // 2
+        lowCells = np.maximum(lowCells, -half)
+        highCells = np.minimum(highCells, lowCells + maxCells - 1)
+        return cellSize, (lowCells, highCells)
+
+    def render(self, dimension: str, filename: str, title: str = "Forsen", maxCells: int = 256):
+        with self.lock:
+            cellSize, bounds = self.pick_cell_size(dimension, maxCells)
+            if cellSize is None:
+                return False
+
+            low, high = bounds
+            grid = self.grids[(dimension, self.PATH, cellSize)]
+
+            cells = np.array(list(grid.keys()), dtype=np.int64)
+            counts = np.array(list(grid.values()), dtype=np.float64)
+            inside = np.all((cells >= low) & (cells <= high), axis=1)
+            cells = cells[inside] - low
+            counts = counts[inside]
+
+            shape = (high[1] - low[1] + 1, high[0] - low[0] + 1)
+            if min(shape) <= 0 or shape[0] * shape[1] > maxCells * maxCells:
+                return False
+
+            dense = np.zeros(shape)
+            dense[cells[:, 1], cells[:, 0]] = counts
+
+            pois = []
+            for (poiDimension, kind, poiCellSize), poiGrid in self.grids.items():
+                if poiDimension != dimension or kind == self.PATH or poiCellSize != cellSize:
+                    continue
+
+                poiCells = np.array(list(poiGrid.keys()), dtype=np.float64)
+                poiCounts = np.array(list(poiGrid.values()), dtype=np.float64)
+                poiInside = np.all((poiCells >= low) & (poiCells <= high), axis=1)
+                if not poiInside.any():
+                    continue
+
+                poiCells = poiCells[poiInside]
+                poiCounts = poiCounts[poiInside]
+                pois.append((kind, (poiCells + 0.5) * cellSize, poiCounts))
+
+            visits = self.visits.get(dimension, 0)
+
+        extent = (high[0] + 1) * cellSize, low[0] * cellSize, low[1] * cellSize, (high[1] + 1) * cellSize
+        plt.imshow(dense, extent=extent, origin="lower", cmap="inferno", norm=LogNorm(vmin=1, vmax=max(dense.max(), 1)))
+        plt.colorbar(label="Samples")
+
+        for phase, poiCenters, poiCounts in pois:
+            plt.scatter(poiCenters[:, 0], poiCenters[:, 1], s=30 + 20 * np.sqrt(poiCounts), zorder=2, label=phase, edgecolors="white")
+
+        plt.scatter(0, 0, marker="*", s=200, color="cyan", edgecolors="black", zorder=3, label="Entry")
+        if pois:
+            plt.legend(loc="upper right", fontsize=8)
+
+        plt.xlabel('X Offset')
+        plt.ylabel('Z Offset')
+        plt.title(f'{title} {dimension.capitalize()} Heatmap ({visits} visits, {cellSize} block cells)')
+
+        plt.savefig(filename)
+        plt.close()
+        return True
@@ -0,0 +1,90 @@
+import json
+import asyncio
+import threading
+
+from quart import Response, abort
+from utils import default
+
+
+@default.app.route('/live')
+@default.app.route('/live/<channel>')
+async def live(channel: str = None):
+    pipelines = default.app.config['MINECRAFT'].pipelines
+    if channel is not None and channel.lower() not in pipelines:
+        abort(404)
+
+    pipeline = default.app.config['MINECRAFT'].get_pipeline(channel)
+    return await pipeline.liveFeed.handle_live()
+
+
+class LiveFeed():
+    # Every update is serialized once and the same bytes are handed to every client queue
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxQueue: int = 64):
+        self.loop = loop
+        self.maxQueue = maxQueue
+
+        self.lock = threading.Lock()
+        self.state = {}
+        self.version = 0
+        self.snapshotPayload = None
+
+        self.clients: set[asyncio.Queue] = set()
+
+    @staticmethod
+    def encode(event: str, version: int, data: dict):
+        return f"event: {event}\nid: {version}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+    def reset(self, **fields):
+        with self.lock:
+            self.state = dict(fields)
+            self.version += 1
+            self.snapshotPayload = None
+            payload = self.encode("snapshot", self.version, self.state)
+            self.loop.call_soon_threadsafe(self.broadcast, payload)
+
+    def update(self, **fields):
+        with self.lock:
+            delta = {key: value for key, value in fields.items() if self.state.get(key) != value}
+            if not delta:
+                return
+
+            self.state.update(delta)
+            self.version += 1
+            self.snapshotPayload = None
+            payload = self.encode("delta", self.version, delta)
+            # Scheduled under the lock, the loop's FIFO then delivers payloads in version order
+            self.loop.call_soon_threadsafe(self.broadcast, payload)
+
+    def snapshot(self):
+        with self.lock:
+            if self.snapshotPayload is None:
+                self.snapshotPayload = self.encode("snapshot", self.version, self.state)
+            return self.snapshotPayload
+
+    def broadcast(self, payload: bytes):
+        for queue in self.clients:
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Slow client, throw away its backlog and let it resync from a fresh snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot())
+
+    async def stream(self, queue: asyncio.Queue):
+        try:
+            yield self.snapshot()
+            while True:
+                yield await queue.get()
+        finally:
+            self.clients.discard(queue)
+
+    async def handle_live(self):
+        queue = asyncio.Queue(maxsize=self.maxQueue)
+        self.clients.add(queue)
+
+        response = Response(self.stream(queue), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        response.timeout = None
+        return response
@@ -0,0 +1,207 @@
+import cv2
+import numpy as np
+
+
+class Matcher():
+    # Scores are normalized to roughly [-1, 1] like TM_CCOEFF_NORMED so detector thresholds carry over
+    name = None
+
+    def __init__(self):
+        self.prepared = {}
+
+    def prepare(self, template):
+        return template
+
+    def prepared_template(self, template):
+        key = id(template)
+        prepared = self.prepared.get(key)
+        if prepared is None:
+            prepared = self.prepare(template)
+            self.prepared[key] = prepared
+        return prepared
+
+    def convert(self, image):
+        return image
+
+    def scores(self, image, template):
+        return cv2.matchTemplate(self.convert(image), self.prepared_template(template), cv2.TM_CCOEFF_NORMED)
+
+    def match(self, image, template):
+        _, maxVal, _, maxLoc = cv2.minMaxLoc(self.scores(image, template))
+        return maxVal, maxLoc
+
+
+class BGRMatcher(Matcher):
+    name = "bgr"
+
+
+class GrayMatcher(Matcher):
+    name = "gray"
+
+    def prepare(self, template):
+        return cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+
+    def convert(self, image):
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+class GlyphMatcher(Matcher):
+    # For the fixed-font UI text: binarize and score the phi coefficient, which is TM_CCOEFF_NORMED on binary images
+    name = "glyph"
+
+    def __init__(self, threshold: int = 128):
+        super().__init__()
+        self.threshold = threshold
+        self.popcount = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+    def convert(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return gray >= self.threshold
+
+    def prepare(self, template):
+        return self.convert(template)
+
+    @staticmethod
+    def phi(n11, n1, n2, size: int):
+        # n11 pixels set in both, n1 set in the glyph, n2 set in the window; a blank window scores 0 like CCOEFF
+        n11 = np.asarray(n11, dtype=np.float64)
+        n2 = np.asarray(n2, dtype=np.float64)
+        numerator = size * n11 - n1 * n2
+        denominator = np.sqrt(n1 * (size - n1) * n2 * (size - n2))
+        return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0).astype(np.float32)
+
+    def scores(self, image, template):
+        image = self.convert(image)
+        glyph = self.prepared_template(template)
+        n1 = np.count_nonzero(glyph)
+
+        if image.shape == glyph.shape:
+            imageBits = np.packbits(image)
+            n11 = self.popcount[np.bitwise_and(imageBits, np.packbits(glyph))].sum()
+            n2 = self.popcount[imageBits].sum()
+            return self.phi([[n11]], n1, [[n2]], glyph.size)
+
+        # Overlap counts per window from one correlation, set pixels per window from the integral image
+        n11 = cv2.matchTemplate(image.astype(np.float32), glyph.astype(np.float32), cv2.TM_CCORR)
+        integral = cv2.integral(image.astype(np.uint8))
+        height, width = glyph.shape
+        n2 = integral[height:, width:] - integral[:-height, width:] - integral[height:, :-width] + integral[:-height, :-width]
+        return self.phi(np.rint(n11), n1, n2, glyph.size)
+
+
+class PyramidMatcher(Matcher):
+    # Coarse match on a downscaled copy, then full resolution only around the coarse peak
+    name = "pyramid"
+
+    def __init__(self, scale: int = 2, fine: Matcher = None):
+        super().__init__()
+        self.scale = scale
+        self.fine = fine or GrayMatcher()
+
+    def downscale(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (gray.shape[1] // self.scale, gray.shape[0] // self.scale), interpolation=cv2.INTER_AREA)
+
+    def prepare(self, template):
+        return self.downscale(template)
+
+    def scores(self, image, template):
+        return self.fine.scores(image, template)
+
+    def match(self, image, template):
+        coarseTemplate = self.prepared_template(template)
+        coarseImage = self.downscale(image)
+
+        if min(coarseTemplate.shape) < 4 or coarseImage.shape[0] < coarseTemplate.shape[0] or coarseImage.shape[1] < coarseTemplate.shape[1]:
+            return self.fine.match(image, template)
+
+        result = cv2.matchTemplate(coarseImage, coarseTemplate, cv2.TM_CCOEFF_NORMED)
+        _, _, _, coarseLoc = cv2.minMaxLoc(result)
+
+        margin = self.scale
+        x = max(coarseLoc[0] * self.scale - margin, 0)
+        y = max(coarseLoc[1] * self.scale - margin, 0)
+        window = image[y:y + template.shape[0] + 2 * margin, x:x + template.shape[1] + 2 * margin]
+
+        maxVal, maxLoc = self.fine.match(window, template)
+        return maxVal, (maxLoc[0] + x, maxLoc[1] + y)
+
+
+MATCHERS = {matcher.name: matcher for matcher in (BGRMatcher(), GrayMatcher(), GlyphMatcher(), PyramidMatcher())}
+
+
+def get_matcher(name: str):
+    return MATCHERS[name]
+
+
+class ColourGate():
+    # Cheap first stage: a match needs roughly as many bright text and dark background pixels as the template has
+    def __init__(self, templates: list, stride: int = 2, tolerance: float = 0.5, bright: int = 200, dark: int = 60):
+        self.stride = stride
+        self.tolerance = tolerance
+        self.bright = bright
+        self.dark = dark
+
+        self.signatures = [self.counts(template) for template in templates]
+
+    def counts(self, image):
+        small = image[::self.stride, ::self.stride].astype(np.uint16)
+        gray = (29 * small[..., 0] + 150 * small[..., 1] + 77 * small[..., 2]) >> 8
+
+        area = self.stride * self.stride
+        return np.count_nonzero(gray >= self.bright) * area, np.count_nonzero(gray <= self.dark) * area
+
+    def fits(self, counts: tuple, index: int):
+        brightCount, darkCount = counts
+        templateBright, templateDark = self.signatures[index]
+        return brightCount >= self.tolerance * templateBright and darkCount >= self.tolerance * templateDark
+
+    def passes(self, image, index: int):
+        return self.fits(self.counts(image), index)
+
+    def candidates(self, image):
+        counts = self.counts(image)
+        return [index for index in range(len(self.signatures)) if self.fits(counts, index)]
+
+
+class TileClassifier():
+    # Masked TM_CCOEFF_NORMED of every tile against every template as a few matrix products instead of tiles * templates matchTemplate calls
+    def __init__(self, templates: list, threshold: float = 0.9):
+        self.threshold = threshold
+        self.shape = templates[0].shape[:2]
+
+        colours = []
+        masks = []
+        for template in templates:
+            if template.shape[2] == 4:
+                mask = (template[..., 3] > 0).astype(np.float32)
+            else:
+                mask = np.ones(self.shape, dtype=np.float32)
+            colours.append(template[..., :3].astype(np.float32))
+            masks.append(np.repeat(mask[..., None], 3, axis=2))
+
+        self.masks = np.stack(masks).reshape(len(templates), -1)
+        self.pixels = self.masks.sum(axis=1)
+
+        # Templates are zero-mean over their mask, so the tile mean only shows up in the variance term
+        colours = np.stack(colours).reshape(len(templates), -1)
+        means = (colours * self.masks).sum(axis=1, keepdims=True) / self.pixels[:, None]
+        self.templates = (colours - means) * self.masks
+        self.templateNorms = np.sqrt((self.templates * self.templates).sum(axis=1))
+
+    def scores(self, tiles: np.ndarray):
+        tiles = tiles.reshape(len(tiles), -1).astype(np.float32)
+
+        sums = tiles @ self.masks.T
+        squares = (tiles * tiles) @ self.masks.T
+        variances = np.maximum(squares - sums * sums / self.pixels, 0)
+
+        denominator = np.sqrt(variances) * self.templateNorms
+        return np.divide(tiles @ self.templates.T, denominator, out=np.zeros_like(denominator), where=denominator > 1e-6)
+
+    def classify(self, tiles: np.ndarray):
+        # Index of the best template per tile, -1 where nothing clears the threshold
+        scores = self.scores(tiles)
+        best = scores.argmax(axis=1)
+        best[scores[np.arange(len(best)), best] < self.threshold] = -1
+        return best
@@ -0,0 +1,122 @@
+import math
+
+
+class AxisKalman():
+    # Constant velocity along one axis, state is [position, velocity]
+    def __init__(self, position: float, accelNoise: float, measurementNoise: float):
+        self.accelNoise = accelNoise
+        self.measurementNoise = measurementNoise
+
+        self.position = position
+        self.velocity = 0.0
+        self.p00, self.p01, self.p10, self.p11 = measurementNoise, 0.0, 0.0, 100.0
+
+    def predict(self, dt: float):
+        self.position += self.velocity * dt
+
+        q = self.accelNoise
+        p00 = self.p00 + dt * (self.p10 + self.p01) + dt * dt * self.p11 + q * dt ** 4 / 4
+        p01 = self.p01 + dt * self.p11 + q * dt ** 3 / 2
+        p10 = self.p10 + dt * self.p11 + q * dt ** 3 / 2
+        p11 = self.p11 + q * dt * dt
+        self.p00, self.p01, self.p10, self.p11 = p00, p01, p10, p11
+
+    def innovation(self, measurement: float):
+        return measurement - self.position, self.p00 + self.measurementNoise
+
+    def correct(self, measurement: float):
+        residual, variance = self.innovation(measurement)
+        k0 = self.p00 / variance
+        k1 = self.p10 / variance
+
+        self.position += k0 * residual
+        self.velocity += k1 * residual
+
+        p00, p01 = self.p00, self.p01
+        self.p00 = (1 - k0) * p00
+        self.p01 = (1 - k0) * p01
+        self.p10 -= k1 * p00
+        self.p11 -= k1 * p01
+
+
+class CoordinateFilter():
+    # Gates OCR reads against the predicted position; a run of consistent rejected reads means a real jump (pearl, respawn)
+    # The gate never grows faster than maxSpeed, and after maxGap seconds without a read the track has to be reacquired
+    def __init__(self, gate: float = 10.0, sigmas: float = 3.0, accelNoise: float = 25.0, measurementNoise: float = 0.5, reacquire: int = 3,
+                 maxSpeed: float = 20.0, maxGap: float = 2.0):
+        self.gate = gate
+        self.sigmas = sigmas
+        self.accelNoise = accelNoise
+        self.measurementNoise = measurementNoise
+        self.reacquire = reacquire
+        self.maxSpeed = maxSpeed
+        self.maxGap = maxGap
+
+        self.reset()
+
+    def reset(self):
+        self.axes = None
+        self.timestamp = None
+        self.candidates = []
+        self.accepted = 0
+        self.rejected = 0
+
+    def start(self, coords: list, timestamp: float):
+        self.axes = [AxisKalman(float(value), self.accelNoise, self.measurementNoise) for value in coords]
+        self.timestamp = timestamp
+        self.candidates = []
+
+    def acquire(self, coords: list, timestamp: float):
+        # Tentative until reacquire consecutive reads agree, so a lone glitch can never become the track
+        if self.candidates and math.dist(self.candidates[-1], coords) > self.gate:
+            self.candidates = []
+        self.candidates.append(coords)
+
+        if len(self.candidates) >= self.reacquire:
+            self.start(coords, timestamp)
+            self.accepted += 1
+            return True
+
+        return False
+
+    def update(self, coords: list, timestamp: float):
+        if self.axes is not None and timestamp - self.timestamp > self.maxGap:
+            # Too long without a read to tell a glitch from real movement
+            self.axes = None
+            self.candidates = []
+
+        if self.axes is None:
+            if self.acquire(coords, timestamp):
+                return True
+            self.rejected += 1
+            return False
+
+        dt = max(timestamp - self.timestamp, 1e-3)
+        for axis in self.axes:
+            axis.predict(dt)
+        self.timestamp = timestamp
+
+        distance = 0.0
+        spread = 0.0
+        for axis, value in zip(self.axes, coords):
+            residual, variance = axis.innovation(value)
+            distance += residual * residual
+            spread += variance
+
+        limit = min(self.gate + self.sigmas * math.sqrt(spread), self.gate + self.maxSpeed * dt)
+        if math.sqrt(distance) <= limit:
+            for axis, value in zip(self.axes, coords):
+                axis.correct(value)
+            self.candidates = []
+            self.accepted += 1
+            return True
+
+        self.rejected += 1
+        return self.acquire(coords, timestamp)
+
+    def estimate(self, timestamp: float, maxExtrapolation: float = 2.0):
+        if self.axes is None:
+            return None
+
+        dt = min(max(timestamp - self.timestamp, 0.0), maxExtrapolation)
+        return [round(axis.position + axis.velocity * dt) for axis in self.axes]
@@ -0,0 +1,96 @@
+import os
+import sys
+import hmac
+import time
+import asyncio
+import threading
+
+from collections import Counter
+
+from quart import Response, abort, request
+from utils import default
+
+
+@default.app.route('/profile')
+async def profile():
+    token = os.environ.get("PROFILE_TOKEN")
+    if token is None or not hmac.compare_digest(request.args.get("token", "").encode(), token.encode()):
+        abort(403)
+
+    try:
+        seconds = float(request.args.get("seconds", 30))
+    except ValueError:
+        return "seconds must be a number", 400
+    if not 0 < seconds <= SamplingProfiler.MAX_SECONDS:
+        return f"seconds must be between 0 and {SamplingProfiler.MAX_SECONDS}", 400
+    try:
+        report = await default.app.config['PROFILER'].profile(seconds)
+    except RuntimeError as e:
+        return str(e), 409
+
+    response = Response(report, mimetype="text/plain")
+    response.headers["Content-Disposition"] = f"attachment; filename=profile-{int(time.time())}.folded"
+    return response
+
+
+class SamplingProfiler():
+    # Samples sys._current_frames() from a side thread, so the detectors run untouched while nobody is profiling
+    MAX_SECONDS = 300
+
+    def __init__(self, labeler=None, interval: float = 1/200):
+        self.labeler = labeler
+        self.interval = interval
+        self.lock = threading.Lock()
+
+    def label(self, threadID: int, threadName: str):
+        if self.labeler is None:
+            return threadName
+
+        return self.labeler(threadID, threadName)
+
+    @staticmethod
+    def fold(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def sample(self, seconds: float):
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError("Profiler already running")
+
+        try:
+            ownID = threading.get_ident()
+            stacks = Counter()
+            samples = Counter()
+
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                threadNames = {thread.ident: thread.name for thread in threading.enumerate()}
+                for threadID, frame in sys._current_frames().items():
+                    if threadID == ownID:
+                        continue
+
+                    label = self.label(threadID, threadNames.get(threadID, str(threadID)))
+                    if label is None:
+                        continue
+
+                    stacks[f"{label};{self.fold(frame)}"] += 1
+                    samples[label] += 1
+
+                time.sleep(self.interval)
+
+            return stacks, samples
+        finally:
+            self.lock.release()
+
+    async def profile_summary(self, seconds: float):
+        stacks, samples = await asyncio.to_thread(self.sample, seconds)
+        report = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        return report, samples
+
+    async def profile(self, seconds: float):
+        report, _ = await self.profile_summary(seconds)
+        return report
@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+
+import numpy as np
+
+from types import SimpleNamespace
+
+
+def detector_rois(bank):
+    # (y1, y2, x1, x2) of every region a detector reads, mirrors the slices in cogs/minecraft.py
+    biomeHeight = max(image.shape[0] for image in bank.biomeImages if image is not None)
+    biomeWidth = max(image.shape[1] for image in bank.biomeImages if image is not None)
+
+    rois = {
+        "igt": (81, 108, 1683, 1890),
+        "f3": (302, 325, 6, 385),
+        "biome": (488, max(516, 489 + biomeHeight), 0, 249 + biomeWidth),
+        "achievement": (882, 960, 461, 927),
+        "crafting": (309, 333, 987, 1107),
+        "inventory": (540, 768, 717, 1203),
+    }
+    for templateText, (y1, y2, x1, x2), _ in bank.otherTemplates:
+        rois[templateText.lower()] = (y1, y2, x1, x2)
+
+    return rois
+
+
+class Recorder():
+    # Keeps only the detector ROIs, and a crop only when it changed since the last one stored for that ROI
+    # Chunks are written on a writer thread so the capture loop never waits on disk. Compressed chunks (.npz) must be
+    # decompressed to be read, only index.npy can be memory mapped; with compress=False every chunk is a folder of
+    # plain .npy files that Recording opens with mmap_mode="r"
+    def __init__(self, path: str, rois: dict, frameShape: tuple, fps: float = 5, chunkSize: int = 100, tolerance: float = 2.0, compress: bool = True):
+        self.path = path
+        self.rois = rois
+        self.frameShape = frameShape
+        self.interval = 1 / fps
+        self.chunkSize = chunkSize
+        self.tolerance = tolerance
+        self.compress = compress
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as metaJson:
+            json.dump({"rois": rois, "frameShape": frameShape, "fps": fps, "chunkSize": chunkSize, "compress": compress}, metaJson)
+
+        self.chunk = 0
+        self.frames = 0
+        self.lastRecorded = 0.0
+        self.index = []
+        self.stored = 0
+        self.skipped = 0
+        self.new_chunk()
+
+        self.writeQueue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_chunks, name="Recorder", daemon=True)
+        self.writer.start()
+
+    def new_chunk(self):
+        # Every chunk starts with a fresh crop per ROI so it can be replayed on its own
+        self.row = 0
+        self.timestamps = np.zeros(self.chunkSize, dtype=np.float64)
+        self.outputs = [None] * self.chunkSize
+        self.crops = {name: [] for name in self.rois}
+        self.rows = {name: np.full(self.chunkSize, -1, dtype=np.int32) for name in self.rois}
+
+    def changed(self, crop: np.ndarray, previous: np.ndarray):
+        return np.abs(crop.astype(np.int16) - previous).mean() > self.tolerance
+
+    def due(self, timestamp: float):
+        return timestamp - self.lastRecorded >= self.interval
+
+    def record(self, frame: np.ndarray, timestamp: float, outputs: dict, hidden: tuple = ()):
+        # ROIs in hidden are not on screen this frame and are left out, replay blanks them
+        if not self.due(timestamp):
+            return
+        self.lastRecorded = timestamp
+
+        for name, (y1, y2, x1, x2) in self.rois.items():
+            if name in hidden:
+                continue
+
+            crop = frame[y1:y2, x1:x2]
+            crops = self.crops[name]
+            if not crops or self.changed(crop, crops[-1]):
+                crops.append(crop.copy())
+                self.stored += 1
+            else:
+                self.skipped += 1
+            self.rows[name][self.row] = len(crops) - 1
+
+        self.timestamps[self.row] = timestamp
+        self.outputs[self.row] = json.dumps(outputs)
+
+        self.index.append((self.frames, timestamp, self.chunk, self.row))
+        self.frames += 1
+        self.row += 1
+
+        if self.row == self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        if self.row == 0:
+            return
+
+        rows = self.row
+        chunk = {}
+        for name, (y1, y2, x1, x2) in self.rois.items():
+            crops = self.crops[name]
+            chunk[f"roi_{name}"] = np.stack(crops) if crops else np.zeros((0, y2 - y1, x2 - x1, 3), dtype=np.uint8)
+            chunk[f"rows_{name}"] = self.rows[name][:rows]
+        chunk["timestamps"] = self.timestamps[:rows]
+        chunk["outputs"] = np.array(self.outputs[:rows])
+
+        self.writeQueue.put((self.chunk, chunk))
+        self.chunk += 1
+        self.new_chunk()
+
+    def write_chunks(self):
+        while True:
+            item = self.writeQueue.get()
+            if item is None:
+                return
+
+            chunkNumber, chunk = item
+            if self.compress:
+                np.savez_compressed(os.path.join(self.path, f"chunk-{chunkNumber:05d}.npz"), **chunk)
+                continue
+
+            chunkPath = os.path.join(self.path, f"chunk-{chunkNumber:05d}")
+            os.makedirs(chunkPath, exist_ok=True)
+            for key, array in chunk.items():
+                np.save(os.path.join(chunkPath, f"{key}.npy"), array)
+
+    def close(self):
+        self.flush()
+        self.writeQueue.put(None)
+        self.writer.join()
+
+        index = np.array(self.index, dtype=[("frame", np.int64), ("timestamp", np.float64), ("chunk", np.int32), ("row", np.int32)])
+        np.save(os.path.join(self.path, "index.npy"), index)
+
+
+class Recording():
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as metaJson:
+            meta = json.loads(metaJson.read())
+
+        self.rois = {name: tuple(roi) for name, roi in meta["rois"].items()}
+        self.frameShape = tuple(meta["frameShape"])
+        self.compress = meta.get("compress", True)
+        self.index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+
+    def chunks(self):
+        chunkNumber = 0
+        while True:
+            chunkPath = os.path.join(self.path, f"chunk-{chunkNumber:05d}")
+            if self.compress and os.path.exists(f"{chunkPath}.npz"):
+                with np.load(f"{chunkPath}.npz") as chunk:
+                    yield {key: chunk[key] for key in chunk.files}
+            elif not self.compress and os.path.isdir(chunkPath):
+                yield {file[:-4]: np.load(os.path.join(chunkPath, file), mmap_mode="r") for file in os.listdir(chunkPath) if file.endswith(".npy")}
+            else:
+                return
+            chunkNumber += 1
+
+    def frames(self):
+        # ROIs are pasted into one reused blank frame, so the detectors read it like a live capture
+        frame = np.zeros(self.frameShape, dtype=np.uint8)
+        for chunk in self.chunks():
+            pasted = {name: None for name in self.rois}
+            for row, timestamp in enumerate(chunk["timestamps"]):
+                for name, (y1, y2, x1, x2) in self.rois.items():
+                    cropIndex = int(chunk[f"rows_{name}"][row])
+                    if cropIndex == pasted[name]:
+                        continue
+
+                    if cropIndex < 0:
+                        frame[y1:y2, x1:x2] = 0
+                    else:
+                        frame[y1:y2, x1:x2] = chunk[f"roi_{name}"][cropIndex]
+                    pasted[name] = cropIndex
+
+                yield timestamp, frame, json.loads(str(chunk["outputs"][row]))
+
+
+def replay(path: str):
+    from cogs.minecraft import TemplateBank, IGT, Biome, Achievement, Coordinates, Inventory, Other
+
+    pipeline = SimpleNamespace(bank=TemplateBank())
+    igt, biome, achievement, other = IGT(pipeline), Biome(pipeline), Achievement(pipeline), Other(pipeline)
+    coordinates, inventory = Coordinates(pipeline), Inventory(pipeline)
+
+    recording = Recording(path)
+    frames = 0
+    start = time.perf_counter()
+    for timestamp, frame, outputs in recording.frames():
+        numbers = igt.read_igt(frame)
+        biomeID = biome.read_biome(frame)
+        achievements = achievement.read_achievements(frame)
+        result = other.read_other(frame)
+        coords = coordinates.parse_coord_numbers(coordinates.read_coord_numbers(frame))
+        counts = inventory.read_inventory(frame)
+
+        print(f"{timestamp:.3f} igt={numbers} biome={biomeID} achievements={achievements} other={result} coords={coords} inventory={counts} recorded={outputs}")
+        frames += 1
+
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {frames} frames in {elapsed:.2f}s ({frames / elapsed if elapsed else 0:.0f} fps)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an ROI recording through the detectors")
+    parser.add_argument("path", help="Recording directory")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.path, "index.npy")):
+        print("Not a finished recording")
+        sys.exit(1)
+
+    replay(args.path)
+
+
+if __name__ == "__main__":
+    main()
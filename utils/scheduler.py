@@ -0,0 +1,193 @@
+import time
+import heapq
+import itertools
+import threading
+
+from collections import deque
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DetectorTask():
+    # target returns True when the detector output changed, which speeds the task up towards minInterval
+    def __init__(self, name: str, target, interval: float, minInterval: float = None, maxInterval: float = None):
+        self.name = name
+        self.target = target
+        self.baseInterval = interval
+        self.minInterval = minInterval or interval
+        self.maxInterval = maxInterval or interval
+        self.interval = interval
+        self.period = interval
+
+        self.cost = 0.0
+        self.ticks = 0
+        self.changes = 0
+
+        self.generation = 0
+        self.active = False
+
+    def adapt(self, changed: bool):
+        if changed:
+            self.changes += 1
+            self.interval = max(self.minInterval, self.interval / 2)
+        else:
+            self.interval = min(self.maxInterval, self.interval * 1.25)
+
+    def stats(self):
+        return {"name": self.name, "interval": self.interval, "period": self.period, "cost": self.cost, "ticks": self.ticks, "changes": self.changes}
+
+
+class DetectorScheduler():
+    # One worker pool for every channel; a detector tick only starts when a worker slot is free
+    USAGE_WINDOW = 10
+    def __init__(self, workers: int, cpuBudget: float = 1.0):
+        self.workers = workers
+        self.cpuBudget = cpuBudget
+        self.tasks: set[DetectorTask] = set()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Detector")
+        self.slots = threading.Semaphore(workers)
+
+        self.condition = threading.Condition()
+        self.queue = []
+        self.counter = itertools.count()
+        self.running = {}
+
+        self.shareCap = None
+        self.spent = deque()
+
+        self.thread = threading.Thread(target=self.dispatch, name="DetectorScheduler", daemon=True)
+        self.thread.start()
+
+    def push(self, task: DetectorTask, due: float):
+        heapq.heappush(self.queue, (due, next(self.counter), task, task.generation))
+        self.condition.notify()
+
+    def add(self, task: DetectorTask):
+        with self.condition:
+            task.generation += 1
+            task.active = True
+            task.interval = task.baseInterval
+            task.period = task.interval
+            self.tasks.add(task)
+            self.push(task, time.monotonic() + task.interval)
+
+    def remove(self, task: DetectorTask):
+        with self.condition:
+            task.generation += 1
+            task.active = False
+            self.tasks.discard(task)
+
+    def next_task(self):
+        with self.condition:
+            while True:
+                while self.queue and self.queue[0][2].generation != self.queue[0][3]:
+                    heapq.heappop(self.queue)
+
+                if not self.queue:
+                    self.condition.wait()
+                    continue
+
+                due, _, task, generation = self.queue[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+                heapq.heappop(self.queue)
+                return task, generation
+
+    def dispatch(self):
+        while True:
+            task, generation = self.next_task()
+            self.slots.acquire()
+            self.executor.submit(self.execute, task, generation)
+
+    def label(self, threadID: int, threadName: str):
+        # Pool threads are named after the detector they are running, idle ones are left out
+        taskName = self.running.get(threadID)
+        if taskName is not None:
+            return taskName
+        if threadName.startswith("Detector"):
+            return None
+        return threadName
+
+    def demand(self):
+        # CPU seconds per second the active tasks would use at their current rates
+        return sum(task.cost / task.interval for task in self.tasks)
+
+    def rebalance(self):
+        # Over budget, load is shed by the tasks that cause it: a task using less than an equal share of the budget keeps
+        # its rate, the rest are capped to one common CPU share, and a task held at maxInterval leaves its part to the others
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.period = task.interval
+
+        demands = [task.cost / task.interval for task in tasks]
+        if sum(demands) <= self.cpuBudget:
+            self.shareCap = None
+            return
+
+        fairShare = self.cpuBudget / len(tasks)
+        heavy = [(task, demand, task.cost / max(task.interval, task.maxInterval)) for task, demand in zip(tasks, demands) if demand > fairShare]
+        remaining = self.cpuBudget - sum(demand for demand in demands if demand <= fairShare)
+
+        def usage(cap: float):
+            return sum(max(min(demand, cap), floor) for _, demand, floor in heavy)
+
+        low, high = 0.0, max(demands)
+        for _ in range(30):
+            middle = (low + high) / 2
+            if usage(middle) > remaining:
+                high = middle
+            else:
+                low = middle
+
+        self.shareCap = low
+        for task, demand, floor in heavy:
+            allowed = max(min(demand, low), floor)
+            if 0 < allowed < demand:
+                task.period = task.cost / allowed
+
+    def usage(self):
+        # CPU seconds per second the detectors actually used over the last USAGE_WINDOW seconds
+        cutoff = time.monotonic() - self.USAGE_WINDOW
+        while self.spent and self.spent[0][0] < cutoff:
+            self.spent.popleft()
+        return sum(cost for _, cost in self.spent) / self.USAGE_WINDOW
+
+    def stats(self):
+        with self.condition:
+            return {
+                "workers": self.workers,
+                "cpuBudget": self.cpuBudget,
+                "demand": self.demand(),
+                "usage": self.usage(),
+                "shareCap": self.shareCap,
+                "tasks": sorted((task.stats() for task in self.tasks), key=lambda taskStats: taskStats["name"]),
+            }
+
+    def execute(self, task: DetectorTask, generation: int):
+        threadID = threading.get_ident()
+        self.running[threadID] = task.name
+
+        start = time.monotonic()
+        cpuStart = time.thread_time()
+        changed = False
+        try:
+            changed = bool(task.target())
+        except Exception as e:
+            print(f"{task.name}: {e}")
+        finally:
+            cost = time.thread_time() - cpuStart
+            self.running.pop(threadID, None)
+            self.slots.release()
+
+            with self.condition:
+                task.ticks += 1
+                task.cost = cost if task.ticks == 1 else 0.9 * task.cost + 0.1 * cost
+                task.adapt(changed)
+                self.spent.append((time.monotonic(), cost))
+                self.rebalance()
+
+                if task.active and task.generation == generation:
+                    self.push(task, max(start + task.period, time.monotonic()))
@@ -0,0 +1,252 @@
+import os
+import json
+import datetime
+import threading
+
+
+class P2Quantile():
+    # Jain & Chlamtac P² estimator, keeps 5 markers no matter how many samples were added
+    def __init__(self, quantile: float, state: dict = None):
+        self.quantile = quantile
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+        if state is not None:
+            self.heights = state["heights"]
+            self.positions = state["positions"]
+            self.desired = state["desired"]
+
+    def toDict(self):
+        return {"heights": self.heights, "positions": self.positions, "desired": self.desired}
+
+    def add(self, value: float):
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= heights[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            diff = self.desired[i] - self.positions[i]
+            if (diff >= 1 and self.positions[i + 1] - self.positions[i] > 1) or (diff <= -1 and self.positions[i - 1] - self.positions[i] < -1):
+                step = 1 if diff > 0 else -1
+
+                height = self.parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self.linear(i, step)
+
+                heights[i] = height
+                self.positions[i] += step
+
+    def parabolic(self, i: int, step: int):
+        q, n = self.heights, self.positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def linear(self, i: int, step: int):
+        q, n = self.heights, self.positions
+        return q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+
+    def value(self):
+        if not self.heights:
+            return None
+
+        if len(self.heights) < 5 or self.positions[4] < 5:
+            return self.heights[round(self.quantile * (len(self.heights) - 1))]
+
+        return self.heights[2]
+
+
+class PhaseStats():
+    QUANTILES = (0.5, 0.9)
+
+    def __init__(self, state: dict = None):
+        self.count = 0
+        self.total = 0.0
+        self.best = None
+        self.sketches = {quantile: P2Quantile(quantile) for quantile in self.QUANTILES}
+
+        if state is not None:
+            self.count = state["count"]
+            self.total = state["total"]
+            self.best = state["best"]
+            for quantile, sketch in state["sketches"].items():
+                self.sketches[float(quantile)] = P2Quantile(float(quantile), sketch)
+
+    def toDict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "best": self.best,
+            "sketches": {str(quantile): sketch.toDict() for quantile, sketch in self.sketches.items()},
+        }
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if self.best is None or seconds < self.best:
+            self.best = seconds
+
+        for sketch in self.sketches.values():
+            sketch.add(seconds)
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, quantile: float):
+        return self.sketches[quantile].value()
+
+
+class SplitStats():
+    # Aggregates are folded in when a run ends, so queries never touch per-run history
+    # A run that got to a terminal phase is finished, not reset
+    TERMINAL_PHASES = ("End",)
+
+    def __init__(self, path: str = "./data/splits.json"):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.runs = 0
+        self.deaths = 0
+        self.deathlessRuns = 0
+        self.resets = {}
+        self.phases: dict[str, PhaseStats] = {}
+
+        self.currentRun = None
+
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as splitsJson:
+            splitsData = json.loads(splitsJson.read())
+
+        self.runs = splitsData["runs"]
+        self.deaths = splitsData["deaths"]
+        self.deathlessRuns = splitsData["deathlessRuns"]
+        self.resets = {phase: count for phase, count in splitsData["resets"].items() if phase not in self.TERMINAL_PHASES}
+        self.phases = {phase: PhaseStats(state) for phase, state in splitsData["phases"].items()}
+
+    def save(self):
+        splitsData = {
+            "runs": self.runs,
+            "deaths": self.deaths,
+            "deathlessRuns": self.deathlessRuns,
+            "resets": self.resets,
+            "phases": {phase: stats.toDict() for phase, stats in self.phases.items()},
+        }
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tempPath = f"{self.path}.tmp"
+        with open(tempPath, "w", encoding="utf-8") as splitsJson:
+            json.dump(splitsData, splitsJson)
+        os.replace(tempPath, self.path)
+
+    @staticmethod
+    def toSeconds(timeIGT: datetime.time):
+        return timeIGT.minute * 60 + timeIGT.second + timeIGT.microsecond / 1_000_000
+
+    def startRun(self):
+        with self.lock:
+            self.currentRun = {"splits": {}, "lastPhase": "Start", "deaths": 0}
+
+    def recordSplit(self, phase: str, timeIGT: datetime.time):
+        with self.lock:
+            if self.currentRun is None or phase in self.currentRun["splits"]:
+                return
+
+            self.currentRun["splits"][phase] = self.toSeconds(timeIGT)
+            self.currentRun["lastPhase"] = phase
+
+    def recordDeath(self):
+        with self.lock:
+            if self.currentRun is not None:
+                self.currentRun["deaths"] += 1
+
+    def endRun(self):
+        with self.lock:
+            run = self.currentRun
+            self.currentRun = None
+
+            if run is None:
+                return
+
+            self.runs += 1
+            self.deaths += run["deaths"]
+            if run["deaths"] == 0:
+                self.deathlessRuns += 1
+
+            if run["lastPhase"] not in self.TERMINAL_PHASES:
+                self.resets[run["lastPhase"]] = self.resets.get(run["lastPhase"], 0) + 1
+
+            for phase, seconds in run["splits"].items():
+                if phase not in self.phases:
+                    self.phases[phase] = PhaseStats()
+                self.phases[phase].add(seconds)
+
+            try:
+                self.save()
+            except OSError as e:
+                print(e)
+
+    def discardRun(self):
+        with self.lock:
+            self.currentRun = None
+
+    def interruptRun(self, terminalPhases: tuple = TERMINAL_PHASES):
+        # The stream stopped mid-seed: only a run that reached a terminal phase counts, anything else would be a fake reset
+        with self.lock:
+            finished = self.currentRun is not None and self.currentRun["lastPhase"] in terminalPhases
+
+        if finished:
+            self.endRun()
+        else:
+            self.discardRun()
+
+    def phaseSummary(self, phase: str):
+        with self.lock:
+            stats = self.phases.get(phase)
+            if stats is None or stats.count == 0:
+                return None
+
+            return {
+                "count": stats.count,
+                "rate": stats.count / self.runs if self.runs else 0,
+                "best": stats.best,
+                "mean": stats.mean(),
+                "percentiles": {quantile: stats.percentile(quantile) for quantile in PhaseStats.QUANTILES},
+                "resets": self.resets.get(phase, 0),
+                "resetRate": None if phase in self.TERMINAL_PHASES else self.resets.get(phase, 0) / stats.count,
+            }
+
+    def runSummary(self):
+        with self.lock:
+            return {
+                "runs": self.runs,
+                "deathsPerRun": self.deaths / self.runs if self.runs else 0,
+                "deathlessRate": self.deathlessRuns / self.runs if self.runs else 0,
+                "startResets": self.resets.get("Start", 0),
+                "startResetRate": self.resets.get("Start", 0) / self.runs if self.runs else 0,
+            }
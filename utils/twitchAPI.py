@@ -1,5 +1,8 @@
 import os
+import time
+import json
 import asyncio
+import hashlib
 
 import discord
 
@@ -11,7 +14,6 @@ from utils import default
 from twitchAPI.twitch import Twitch
 from twitchAPI.oauth import UserAuthenticator
 from twitchAPI.types import AuthScope
-from twitchAPI.helper import first
 from twitchAPI.eventsub import EventSub
 #from pyngrok import ngrok
 
@@ -26,11 +28,27 @@ async def login_callback():
     return await default.app.config['TWITCH_API'].handle_login_callback()
 
 
+class TwitchChannel():
+    def __init__(self, login: str):
+        self.login = login
+        self.userID = None
+        self.displayName = login
+        self.isOnline = False
+        self.isIntro = False
+        self.onlineEvent_checked = True
+        self.game = None
+
+
 class TwitchAPI():
+    USER_CACHE_PATH = "./data/twitch_users.json"
+    USER_CACHE_TTL = 7 * 24 * 60 * 60
+    SECRET_HASH_PATH = "./data/eventsub_secret.sha256"
+
     def __init__(self, client: discord.Client, loop: asyncio.AbstractEventLoop):
         self.client: default.DiscordBot = client
         self.loop = loop
-        self.isIntro = False
+        self.channels = {login: TwitchChannel(login) for login in self.client.minecraft.channels}
+        self.reconcileInterval = int(os.environ.get("TWITCH_RECONCILE_SECONDS", 5 * 60))
 
     async def handle_login(self):
         url = self.auth.return_auth_url()
@@ -40,30 +58,79 @@ class TwitchAPI():
         code = request.args.get('code')
         token, refresh_token = await self.auth.authenticate(user_token=code)
         await self.TWITCH.set_user_authentication(token, self.target_scope, refresh_token)
-        
-        if self.isOnline and self.game == "Minecraft":
-            await self.client.minecraft.startStreamlink()
+
+        for channel in self.channels.values():
+            if channel.isOnline and channel.game == "Minecraft":
+                await self.client.minecraft.pipelines[channel.login].startStreamlink()
 
         return redirect('/')
 
+    def load_user_cache(self):
+        if not os.path.exists(self.USER_CACHE_PATH):
+            return {}
+
+        with open(self.USER_CACHE_PATH, "r", encoding="utf-8") as usersJson:
+            users = json.loads(usersJson.read())
+
+        now = time.time()
+        return {login: user for login, user in users.items() if now - user["cachedAt"] < self.USER_CACHE_TTL}
+
+    def save_user_cache(self, users: dict):
+        os.makedirs(os.path.dirname(self.USER_CACHE_PATH), exist_ok=True)
+        with open(self.USER_CACHE_PATH, "w", encoding="utf-8") as usersJson:
+            json.dump(users, usersJson)
+
+    async def resolve_users(self):
+        users = self.load_user_cache()
+
+        missing = [login for login in self.channels if login not in users]
+        if missing:
+            async for user in self.TWITCH.get_users(logins=missing):
+                users[user.login] = {"id": user.id, "display_name": user.display_name, "cachedAt": time.time()}
+
+            try:
+                self.save_user_cache(users)
+            except OSError as e:
+                print(e)
+
+        for login, user in users.items():
+            if login in self.channels:
+                self.channels[login].userID = user["id"]
+                self.channels[login].displayName = user["display_name"]
+
+    async def fetch_status(self):
+        userIDs = [channel.userID for channel in self.channels.values() if channel.userID is not None]
+
+        async def get_online():
+            return {stream.user_id async for stream in self.TWITCH.get_streams(user_id=userIDs)}
+
+        onlineIDs, channelInformation = await asyncio.gather(get_online(), self.TWITCH.get_channel_information(userIDs))
+        return onlineIDs, {information.broadcaster_id: information.game_name for information in channelInformation}
+
     async def main(self):
         self.TWITCH = await Twitch(os.environ["TWITCH_TEST_ID"], os.environ["TWITCH_TEST_SECRET"])
         self.target_scope = [AuthScope.BITS_READ]
         self.auth = UserAuthenticator(self.TWITCH, self.target_scope, force_verify=False, url=f"{os.environ['APIHOST']}/login/callback")
 
-        self.user = await first(self.TWITCH.get_users(logins="forsen"))
-        self.stream = await first(self.TWITCH.get_streams(user_id=[self.user.id]))
-        self.channel = await self.TWITCH.get_channel_information(self.user.id)
+        await self.resolve_users()
+        onlineIDs, games = await self.fetch_status()
 
-        self.isOnline = self.stream is not None
-        self.game = self.channel[0].game_name
+        for channel in self.channels.values():
+            if channel.userID is None:
+                print(f"Channel {channel.login} not found")
+                continue
 
-        print(f"Online: {self.isOnline}")
-        print(f"Channel name: {self.user.display_name}")
-        print(f"Channel game: {self.game}")
+            channel.isOnline = channel.userID in onlineIDs
+            channel.game = games.get(channel.userID)
 
-        if self.isOnline and self.game == "Minecraft":
-            await self.client.minecraft.startMain()
+            print(f"Channel name: {channel.displayName}")
+            print(f"Online: {channel.isOnline}")
+            print(f"Channel game: {channel.game}")
+
+            if channel.isOnline and channel.game == "Minecraft":
+                await self.client.minecraft.startMain(channel.login)
+            elif channel.isOnline:
+                self.loop.create_task(self.client.minecraft.standby(channel.login))
 
         # http_tunnel = ngrok.connect(8080, bind_tls=True)
         # event_sub = EventSub(http_tunnel.public_url, os.environ["TWITCH_TEST_ID"], 8080, self.TWITCH)
@@ -72,63 +139,163 @@ class TwitchAPI():
         event_sub = EventSub(os.environ["HOST"], os.environ["TWITCH_TEST_ID"], 8080, self.TWITCH)
         event_sub.wait_for_subscription_confirm = False
 
-        await event_sub.unsubscribe_all()
-
         event_sub.start()
 
-        await event_sub.listen_channel_update(self.user.id, self.on_update)
-
-        await event_sub.listen_stream_online(self.user.id, self.on_online)
-
-        await event_sub.listen_stream_offline(self.user.id, self.on_offline)
-
-
-    async def checkIfActuallyOnline(self):
+        await self.sync_subscriptions(event_sub)
+
+        self.loop.create_task(self.reconcile())
+
+    def load_secret_hash(self):
+        if not os.path.exists(self.SECRET_HASH_PATH):
+            return None
+
+        with open(self.SECRET_HASH_PATH, "r", encoding="utf-8") as secretFile:
+            return secretFile.read().strip()
+
+    def save_secret_hash(self, secretHash: str = None):
+        if secretHash is None:
+            if os.path.exists(self.SECRET_HASH_PATH):
+                os.remove(self.SECRET_HASH_PATH)
+            return
+
+        os.makedirs(os.path.dirname(self.SECRET_HASH_PATH), exist_ok=True)
+        with open(self.SECRET_HASH_PATH, "w", encoding="utf-8") as secretFile:
+            secretFile.write(secretHash)
+
+    async def sync_subscriptions(self, event_sub: EventSub):
+        listeners = {
+            "channel.update": (event_sub.listen_channel_update, self.on_update),
+            "stream.online": (event_sub.listen_stream_online, self.on_online),
+            "stream.offline": (event_sub.listen_stream_offline, self.on_offline),
+        }
+        wanted = {(subType, channel.userID) for subType in listeners for channel in self.channels.values() if channel.userID is not None}
+
+        # Webhook subscriptions are signed with the EventSub secret, so they can only be kept across restarts with a fixed one
+        # Only subscriptions made with the same secret verify, so the hash of the secret they were made with is stored next to them
+        secret = os.environ.get("EVENTSUB_SECRET")
+        if secret is None:
+            await event_sub.unsubscribe_all()
+            self.save_secret_hash(None)
+        else:
+            event_sub.secret = secret
+            secretHash = hashlib.sha256(secret.encode()).hexdigest()
+            sameSecret = self.load_secret_hash() == secretHash
+
+            # Reusing a subscription means registering its callback in EventSub's name mangled private __callbacks dict
+            # ({'id', 'callback', 'active'} in twitchAPI 3.11, eventsub.py __add_callback); without it everything is recreated
+            callbacks = getattr(event_sub, "_EventSub__callbacks", None)
+            if not isinstance(callbacks, dict):
+                callbacks = None
+                sameSecret = False
+
+            kept = set()
+            async for subscription in await self.TWITCH.get_eventsub_subscriptions():
+                key = (subscription.type, subscription.condition.get("broadcaster_user_id"))
+                isOurs = subscription.transport.get("callback", "").startswith(os.environ["HOST"])
+
+                if sameSecret and isOurs and subscription.status == "enabled" and key in wanted and key not in kept:
+                    kept.add(key)
+                    callbacks[subscription.id] = {"id": subscription.id, "callback": listeners[subscription.type][1], "active": True}
+                else:
+                    await self.TWITCH.delete_eventsub_subscription(subscription.id)
+
+            wanted -= kept
+            self.save_secret_hash(secretHash)
+            print(f"Kept {len(kept)} EventSub subscriptions")
+
+        for subType, userID in wanted:
+            listen, callback = listeners[subType]
+            await listen(userID, callback)
+
+    async def reconcile(self):
+        # Catches missed EventSub notifications without a restart
+        while True:
+            await asyncio.sleep(self.reconcileInterval)
+
+            try:
+                onlineIDs, games = await self.fetch_status()
+            except Exception as e:
+                print(e)
+                continue
+
+            for channel in self.channels.values():
+                if channel.userID is None:
+                    continue
+
+                isOnline = channel.userID in onlineIDs
+                game = games.get(channel.userID)
+
+                if isOnline and not channel.isOnline:
+                    print(f"Reconcile: {channel.login} is online")
+                    channel.isOnline = True
+                    channel.onlineEvent_checked = True
+                elif not isOnline and channel.isOnline and channel.onlineEvent_checked:
+                    print(f"Reconcile: {channel.login} is offline")
+                    await self.setOffline(channel)
+                    continue
+
+                if isOnline and game != channel.game:
+                    print(f"Reconcile: {channel.login} is playing {game}")
+                    channel.isIntro = False
+                    channel.game = game
+
+                if isOnline and channel.game == "Minecraft":
+                    await self.client.minecraft.startMain(channel.login)
+
+    async def checkIfActuallyOnline(self, channel: TwitchChannel):
         await asyncio.sleep(5 * 60)
-        if self.onlineEvent_checked is False:
-            print("Changed title but didn't go online after 5 minutes")
+        if channel.onlineEvent_checked is False:
+            print(f"{channel.login} changed title but didn't go online after 5 minutes")
 
-            self.isOnline = False
+            channel.isOnline = False
+            await self.client.minecraft.stopMain(channel.login)
 
-    async def onlineCheck(self):
-        print("Online")
+    async def onlineCheck(self, channel: TwitchChannel):
+        print(f"{channel.login} online")
 
-        self.isOnline = True
-        self.onlineEvent_checked = False
-        self.isIntro = True
+        channel.isOnline = True
+        channel.onlineEvent_checked = False
+        channel.isIntro = True
 
-        self.loop.create_task(self.checkIfActuallyOnline())
+        self.loop.create_task(self.checkIfActuallyOnline(channel))
+        self.loop.create_task(self.client.minecraft.standby(channel.login))
 
     async def updateEvent(self, data: dict):
-        print("Update")
+        channel = self.channels[data["event"]["broadcaster_user_login"]]
+        print(f"{channel.login} update")
 
-        if self.isOnline:
-            if self.game != data["event"]["category_name"]:
-                self.isIntro = False
+        if channel.isOnline:
+            if channel.game != data["event"]["category_name"]:
+                channel.isIntro = False
 
             if data["event"]["category_name"] == "Minecraft":
-                await self.client.minecraft.startMain()
+                await self.client.minecraft.startMain(channel.login)
         else:
-            await self.onlineCheck()
+            await self.onlineCheck(channel)
 
-        self.game = data["event"]["category_name"]
+        channel.game = data["event"]["category_name"]
 
     async def onlineEvent(self, data: dict):
-        print("Online Event")
+        channel = self.channels[data["event"]["broadcaster_user_login"]]
+        print(f"{channel.login} online event")
 
-        if self.isOnline is False:
-            print("Went live without changing the title")
-            await self.onlineCheck()
+        if channel.isOnline is False:
+            print(f"{channel.login} went live without changing the title")
+            await self.onlineCheck(channel)
 
-        self.onlineEvent_checked = True
+        channel.onlineEvent_checked = True
 
-    async def offlineEvent(self):
-        print("Offline")
+    async def offlineEvent(self, data: dict):
+        channel = self.channels[data["event"]["broadcaster_user_login"]]
+        print(f"{channel.login} offline")
 
-        self.isOnline = False
-        self.isIntro = False
+        await self.setOffline(channel)
+
+    async def setOffline(self, channel: TwitchChannel):
+        channel.isOnline = False
+        channel.isIntro = False
 
-        await self.client.minecraft.stopMain()
+        await self.client.minecraft.stopMain(channel.login)
 
     async def on_update(self, data: dict):
         self.loop.create_task(self.updateEvent(data))
@@ -137,4 +304,4 @@ class TwitchAPI():
         self.loop.create_task(self.onlineEvent(data))
 
     async def on_offline(self, data: dict):
-        self.loop.create_task(self.offlineEvent())
+        self.loop.create_task(self.offlineEvent(data))